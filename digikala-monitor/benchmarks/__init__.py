@@ -0,0 +1 @@
+"""Offline benchmarks (see benchmarks/run.py)"""
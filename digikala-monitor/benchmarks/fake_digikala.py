@@ -0,0 +1,194 @@
+"""
+Local stand-in for Digikala used by the benchmarks
+
+Serves synthetic product pages at /product/dkp-<id>/ (an <h1>, the price
+container DigikalaScraper waits for and a __NEXT_DATA__ script) and the
+product API at /api/v2/product/<id>/. Latency, page size and how often
+prices change are configurable.
+
+Usage:
+    python -m benchmarks.fake_digikala --port 8765 --latency-ms 50
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+PRODUCT_PATH_RE = re.compile(r"^/product/dkp-(\d+)/?$")
+API_PATH_RE = re.compile(r"^/api/v2/product/(\d+)/?$")
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="fa" dir="rtl">
+<head><meta charset="UTF-8"><title>{name}</title></head>
+<body>
+<h1>{name}</h1>
+<div data-theme-animation="price-container">{price_text} تومان</div>
+<div class="padding">{padding}</div>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+</body>
+</html>
+"""
+
+PERSIAN_DIGITS = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+
+
+class FakeCatalog:
+    """Product prices of the fake shop, changing with probability `churn` per request"""
+
+    def __init__(self, churn: float = 0.1, seed: Optional[int] = None):
+        self.churn = churn
+        self._random = random.Random(seed)
+        self._prices: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def price(self, product_id: int) -> int:
+        """Current price in Toman, possibly changed by this request"""
+        with self._lock:
+            price = self._prices.get(product_id)
+            if price is None:
+                price = self._random.randrange(100, 50000) * 1000
+            elif self._random.random() < self.churn:
+                change = 1 + self._random.uniform(-0.1, 0.1)
+                price = max(1000, int(price * change) // 1000 * 1000)
+            self._prices[product_id] = price
+            return price
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes concurrent clients wait for SYN retries
+    request_queue_size = 128
+
+
+class FakeDigikalaServer:
+    """Threaded HTTP server running in the background"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0,
+                 page_kb: int = 50, churn: float = 0.1, api_enabled: bool = True,
+                 error_rate: float = 0, seed: Optional[int] = None):
+        """
+        Initialize server
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free port)
+            latency_ms: Delay added to every response
+            page_kb: Approximate size of a product page
+            churn: Probability that a product's price changes on a request
+            api_enabled: Serve the product API (otherwise it answers 404,
+                so TieredFetcher falls back to the embedded page data)
+            error_rate: Share of requests answered with 429 Too Many Requests
+            seed: Random seed for reproducible prices
+        """
+        self.latency = latency_ms / 1000
+        self.page_kb = page_kb
+        self.api_enabled = api_enabled
+        self.error_rate = error_rate
+        self._errors = random.Random(seed)
+        self.catalog = FakeCatalog(churn, seed)
+        self.requests = 0
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def product_url(self, product_id: int) -> str:
+        return f"{self.base_url}/product/dkp-{product_id}/"
+
+    @property
+    def api_url_template(self) -> str:
+        return f"{self.base_url}/api/v2/product/{{product_id}}/"
+
+    def start(self) -> "FakeDigikalaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def product_payload(self, product_id: int) -> Dict:
+        """API-shaped product object (prices in Rial, like the real API)"""
+        return {
+            "id": product_id,
+            "title_fa": f"محصول آزمایشی {product_id}",
+            "default_variant": {"price": {"selling_price": self.catalog.price(product_id) * 10}}
+        }
+
+    def render_page(self, product_id: int) -> bytes:
+        product = self.product_payload(product_id)
+        price = product["default_variant"]["price"]["selling_price"] // 10
+        next_data = json.dumps({"props": {"pageProps": {"product": product}}}, ensure_ascii=False)
+        return PAGE_TEMPLATE.format(
+            name=product["title_fa"],
+            price_text=f"{price:,}".translate(PERSIAN_DIGITS).replace(",", "٬"),
+            padding="x" * (self.page_kb * 1024),
+            next_data=next_data
+        ).encode("utf-8")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.error_rate and server._errors.random() < server.error_rate:
+                    self._send(429, "text/plain", b"too many requests")
+                    return
+
+                match = PRODUCT_PATH_RE.match(self.path)
+                if match:
+                    self._send(200, "text/html; charset=utf-8", server.render_page(int(match.group(1))))
+                    return
+
+                match = API_PATH_RE.match(self.path)
+                if match and server.api_enabled:
+                    body = json.dumps({"status": 200, "data": {"product": server.product_payload(int(match.group(1)))}})
+                    self._send(200, "application/json", body.encode("utf-8"))
+                    return
+
+                self._send(404, "text/plain", b"not found")
+
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Digikala server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--page-kb", type=int, default=50)
+    parser.add_argument("--churn", type=float, default=0.1)
+    parser.add_argument("--no-api", action="store_true", help="Answer 404 on the product API")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with 429")
+    args = parser.parse_args()
+
+    fake = FakeDigikalaServer(port=args.port, latency_ms=args.latency_ms, page_kb=args.page_kb,
+                              churn=args.churn, api_enabled=not args.no_api,
+                              error_rate=args.error_rate)
+    print(f"🧪 Fake Digikala listening on {fake.base_url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
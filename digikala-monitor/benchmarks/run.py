@@ -0,0 +1,429 @@
+"""
+Offline benchmarks against the fake Digikala server
+
+Runs three benchmarks and writes the results as JSON:
+    fetch  - TieredFetcher / DigikalaScraper calls: throughput and latency percentiles
+    sweep  - PriceScheduler.check_all_products end to end on a temporary database
+    db     - PriceDatabase.update_prices_bulk write rates per history mode
+    workers - one pass over all products by --processes PriceWorker processes
+              sharing SQLite leases
+
+Usage (from the digikala-monitor directory):
+    python -m benchmarks.run --products 200 --latency-ms 50 --output results.json
+    python -m benchmarks.run --tier browser --products 20      # needs Chromium
+    python -m benchmarks.run --compare results.json            # diff against a previous run
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from price_monitor.database import PriceDatabase
+from price_monitor.leases import SQLiteLeaseBackend
+from price_monitor.ratelimit import HostRateLimiter
+from price_monitor.scheduler import PriceScheduler
+from price_monitor.scraper import DigikalaScraper, TieredFetcher
+from price_monitor.worker import PriceWorker
+
+from .fake_digikala import FakeDigikalaServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latency samples in milliseconds"""
+    if not samples:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    if len(samples) == 1:
+        cuts = samples * 99
+    else:
+        cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def memory_mb() -> Dict[str, Optional[float]]:
+    """Current and peak resident memory of this process"""
+    current = None
+    try:
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    peak = None
+    if resource is not None:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        peak = peak_kb / 2 ** 20 if sys.platform == "darwin" else peak_kb / 1024
+    return {
+        'rss_mb': round(current, 1) if current is not None else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class NullNotifier:
+    """Notifier that accepts everything, so sweeps never touch SMTP"""
+
+    digest_mode = "off"
+    digest_window = 600
+    last_error = None
+
+    def send_digest(self, drops, message_id=None) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+class TimedDatabase(PriceDatabase):
+    """PriceDatabase that records how long price writes take"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows_written = 0
+        self.write_batches = 0
+        self.write_seconds = 0.0
+
+    def update_prices_bulk(self, results, enqueue_notifications=False):
+        started = time.perf_counter()
+        try:
+            return super().update_prices_bulk(results, enqueue_notifications)
+        finally:
+            self.write_seconds += time.perf_counter() - started
+            self.write_batches += 1
+            self.rows_written += len(results)
+
+
+class TimedScraper:
+    """Wraps a scraper and records the latency of every scrape_product call"""
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.latencies: List[float] = []
+        self.failures = 0
+
+    async def scrape_product(self, url: str) -> Optional[dict]:
+        started = time.perf_counter()
+        info = await self.scraper.scrape_product(url)
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        if not info:
+            self.failures += 1
+        return info
+
+    async def close(self):
+        await self.scraper.close()
+
+
+def build_fetcher(api_url_template: str, args) -> TieredFetcher:
+    scraper = DigikalaScraper(
+        pool_size=args.concurrency, headless=True,
+        # The fake shop is not on digikala.com; lean mode would block it as third-party
+        allowed_hosts=("127.0.0.1", "localhost")
+    )
+    return TieredFetcher(
+        scraper,
+        http_enabled=args.tier != "browser",
+        api_url_template=api_url_template,
+        max_connections=args.concurrency,
+        # Every call should reach the server
+        cache_ttl=0,
+        rate_limiter=HostRateLimiter(
+            rate=args.rate_limit, burst=args.concurrency, max_rate=args.rate_limit * 4,
+            # Same ramp-up per request as the defaults (0.05 at 2/s), relative to the rate
+            increase_step=args.rate_limit / 40
+        ) if args.rate_limit else None
+    )
+
+
+async def bench_fetch(fake: FakeDigikalaServer, args) -> Dict:
+    fetcher = TimedScraper(build_fetcher(fake.api_url_template, args))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    urls = [fake.product_url(product_id) for product_id in range(1, args.products + 1)]
+
+    async def fetch(url):
+        async with semaphore:
+            await fetcher.scrape_product(url)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(fetch(url) for url in urls))
+    finally:
+        elapsed = time.perf_counter() - started
+        await fetcher.close()
+
+    return {
+        'requests': len(urls),
+        'failures': fetcher.failures,
+        'seconds': round(elapsed, 3),
+        'throughput_per_s': round(len(urls) / elapsed, 2),
+        **percentiles(fetcher.latencies),
+        'tiers': fetcher.scraper.stats,
+        'rate_limit': fetcher.scraper.rate_limiter.stats() if fetcher.scraper.rate_limiter else None,
+        **memory_mb(),
+    }
+
+
+async def bench_sweep(fake: FakeDigikalaServer, args, workdir: str) -> Dict:
+    db = TimedDatabase(os.path.join(workdir, "sweep.db"), history_mode=args.history_mode)
+    for product_id in range(1, args.products + 1):
+        db.add_product(fake.product_url(product_id), f"محصول آزمایشی {product_id}", 1000)
+
+    scraper = TimedScraper(build_fetcher(fake.api_url_template, args))
+    scheduler = PriceScheduler(
+        db, scraper, NullNotifier(), max_workers=args.concurrency,
+        product_delay=0, flush_size=args.flush_size
+    )
+
+    sweep_seconds = []
+    try:
+        for _ in range(args.sweeps):
+            started = time.perf_counter()
+            await scheduler.check_all_products()
+            sweep_seconds.append(time.perf_counter() - started)
+    finally:
+        await scraper.close()
+        scheduler.async_db.shutdown()
+        scheduler.async_notifier.shutdown()
+
+    checks = args.products * args.sweeps
+    total = sum(sweep_seconds)
+    outbox = db.get_outbox_stats()
+    db.close()
+    return {
+        'products': args.products,
+        'sweeps': args.sweeps,
+        'sweep_seconds': [round(seconds, 3) for seconds in sweep_seconds],
+        'throughput_per_s': round(checks / total, 2) if total else 0.0,
+        'failures': scraper.failures,
+        **percentiles(scraper.latencies),
+        'db_rows_written': db.rows_written,
+        'db_write_batches': db.write_batches,
+        'db_write_seconds': round(db.write_seconds, 4),
+        'db_rows_per_s': round(db.rows_written / db.write_seconds, 1) if db.write_seconds else 0.0,
+        'notifications_queued': sum(outbox.values()) if isinstance(outbox, dict) else outbox,
+        **memory_mb(),
+    }
+
+
+def bench_db(args, workdir: str) -> Dict:
+    results = {}
+    rng = random.Random(args.seed)
+    for mode in ("full", "compact"):
+        path = os.path.join(workdir, f"db-{mode}.db")
+        db = PriceDatabase(path, history_mode=mode)
+        urls = [f"https://www.digikala.com/product/dkp-{i}/" for i in range(1, args.products + 1)]
+        prices = {url: 1000 for url in urls}
+        for url in urls:
+            db.add_product(url, url, 1000)
+
+        batch_latencies = []
+        started = time.perf_counter()
+        for _ in range(args.db_rounds):
+            for url in urls:
+                if rng.random() < args.churn:
+                    prices[url] = max(1000, prices[url] + rng.choice((-1, 1)) * 1000)
+            for start in range(0, len(urls), args.flush_size):
+                batch = [(url, prices[url]) for url in urls[start:start + args.flush_size]]
+                batch_started = time.perf_counter()
+                db.update_prices_bulk(batch)
+                batch_latencies.append((time.perf_counter() - batch_started) * 1000)
+        elapsed = time.perf_counter() - started
+
+        history_rows = db._connection().execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
+        db.close()
+        rows = args.products * args.db_rounds
+        results[mode] = {
+            'rows_written': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_s': round(rows / elapsed, 1),
+            'batches_per_s': round(len(batch_latencies) / elapsed, 1),
+            **percentiles(batch_latencies),
+            'history_rows': history_rows,
+            'file_mb': round(sum(
+                os.path.getsize(path + suffix) for suffix in ("", "-wal")
+                if os.path.exists(path + suffix)
+            ) / 2 ** 20, 2),
+        }
+    return results
+
+
+async def _run_worker(db_path: str, api_url_template: str, args) -> Dict:
+    db = PriceDatabase(db_path, history_mode=args.history_mode)
+    scraper = TimedScraper(build_fetcher(api_url_template, args))
+    scheduler = PriceScheduler(
+        db, scraper, NullNotifier(), max_workers=args.concurrency,
+        product_delay=0, flush_size=args.flush_size
+    )
+    worker = PriceWorker(scheduler, SQLiteLeaseBackend(db), batch_size=args.flush_size)
+    started = time.time()
+    await worker.run(until_idle=True)
+    finished = time.time()
+    db.close()
+    return dict(worker.stats, latencies=scraper.latencies, started=started, finished=finished)
+
+
+def worker_process(db_path: str, api_url_template: str, args, results):
+    """Body of one benchmark worker process"""
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        results.put(asyncio.run(_run_worker(db_path, api_url_template, args)))
+
+
+def bench_workers(fake: FakeDigikalaServer, args, workdir: str) -> Dict:
+    db_path = os.path.join(workdir, "workers.db")
+    db = PriceDatabase(db_path, history_mode=args.history_mode)
+    for product_id in range(1, args.products + 1):
+        db.add_product(fake.product_url(product_id), f"محصول آزمایشی {product_id}", 1000)
+    db.close()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_process, args=(db_path, fake.api_url_template, args, results))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    # From the first worker starting to check until the last one is done
+    # (interpreter start-up of the spawned processes is not counted)
+    elapsed = max(worker['finished'] for worker in stats) - min(worker['started'] for worker in stats)
+    checked = sum(worker['checked'] for worker in stats)
+    return {
+        'processes': args.processes,
+        'products': args.products,
+        'seconds': round(elapsed, 3),
+        'throughput_per_s': round(checked / elapsed, 2) if elapsed else 0.0,
+        'checked': checked,
+        # Products checked more than once in the pass (should be 0)
+        'duplicates': checked - args.products,
+        'failures': sum(worker['failed'] for worker in stats),
+        'per_process': [worker['checked'] for worker in stats],
+        **percentiles([latency for worker in stats for latency in worker['latencies']]),
+    }
+
+
+def compare(previous: Dict, current: Dict, prefix: str = "") -> List[str]:
+    """Lines describing how numeric results changed between two runs"""
+    lines = []
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            lines.extend(compare(old or {}, value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and isinstance(old, (int, float)) and not isinstance(old, bool):
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"{name:45} {old:>12} -> {value:>12}  ({change})")
+    return lines
+
+
+async def run(args) -> Dict:
+    fake = FakeDigikalaServer(latency_ms=args.latency_ms, page_kb=args.page_kb,
+                              churn=args.churn, api_enabled=args.tier == "api",
+                              error_rate=args.error_rate, seed=args.seed).start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            if "fetch" in args.only:
+                results['fetch'] = await bench_fetch(fake, args)
+            if "sweep" in args.only:
+                results['sweep'] = await bench_sweep(fake, args, workdir)
+            if "db" in args.only:
+                results['db'] = bench_db(args, workdir)
+            if "workers" in args.only:
+                results['workers'] = bench_workers(fake, args, workdir)
+    finally:
+        fake.stop()
+    results['server_requests'] = fake.requests
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline price monitor benchmarks")
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4, help="Workers / browser contexts")
+    parser.add_argument("--tier", choices=("api", "embedded", "browser"), default="api",
+                        help="Fetch path to exercise (browser needs Chromium)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake server response delay")
+    parser.add_argument("--page-kb", type=int, default=50, help="Fake product page size")
+    parser.add_argument("--churn", type=float, default=0.1, help="Price change probability per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="Starting requests/s of the per-host rate limiter (0: no limiter)")
+    parser.add_argument("--sweeps", type=int, default=3)
+    parser.add_argument("--flush-size", type=int, default=25)
+    parser.add_argument("--history-mode", choices=("full", "compact"), default="compact")
+    parser.add_argument("--db-rounds", type=int, default=20, help="Update rounds of the db benchmark")
+    parser.add_argument("--processes", type=int, default=2, help="Processes of the workers benchmark")
+    parser.add_argument("--only", nargs="+", choices=("fetch", "sweep", "db", "workers"),
+                        default=["fetch", "sweep", "db", "workers"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's output")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        results = asyncio.run(run(args))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': vars(args),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"💾 Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"\n📊 Compared with {args.compare} ({previous['meta'].get('commit')}):")
+        print("\n".join(compare(previous.get('results', {}), results)))
+
+
+if __name__ == "__main__":
+    main()
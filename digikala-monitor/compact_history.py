@@ -0,0 +1,33 @@
+"""
+One-time compaction of price_history
+
+Merges consecutive identical prices of each product into a single run row
+(first seen, last seen, observation count). Run it once when switching
+DATABASE_CONFIG["history_mode"] to "compact" on an existing database.
+
+Usage:
+    python compact_history.py [--vacuum]
+"""
+
+import sys
+
+try:
+    from config import DATABASE_CONFIG
+except ImportError:
+    print("❌ Error: config.py not found!")
+    print("📝 Please copy config.example.py to config.py and fill in your details")
+    sys.exit(1)
+
+from price_monitor.database import PriceDatabase
+
+db = PriceDatabase(**DATABASE_CONFIG)
+
+print(f"🗜️ Compacting price history in {db.db_path}...")
+result = db.compact_history()
+print(f"✅ {result['products']} products processed, {result['rows_removed']:,} rows removed")
+
+if "--vacuum" in sys.argv:
+    print("🧹 Reclaiming disk space (VACUUM)...")
+    db.vacuum()
+
+db.close()
@@ -0,0 +1,84 @@
+"""
+Bulk import of products from a file
+
+Reads product links from a text or CSV file (or stdin), skips invalid
+links, duplicates and products that are already monitored, scrapes the
+rest concurrently and adds them in one database transaction. The web
+interface does not need to be stopped.
+
+Usage:
+    python import_products.py wishlist.csv [--concurrency 8]
+    cat urls.txt | python import_products.py -
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+try:
+    from config import (
+        SCHEDULER_CONFIG,
+        SCRAPER_CONFIG,
+        FETCHER_CONFIG,
+        RATE_LIMIT_CONFIG,
+        DATABASE_CONFIG
+    )
+except ImportError:
+    print("❌ Error: config.py not found!")
+    print("📝 Please copy config.example.py to config.py and fill in your details")
+    sys.exit(1)
+
+from price_monitor.database import PriceDatabase
+from price_monitor.executors import AsyncFacade
+from price_monitor.importer import ProductImporter, parse_urls
+from price_monitor.ratelimit import create_rate_limiter
+from price_monitor.scraper import DigikalaScraper, TieredFetcher
+
+
+def show_progress(progress):
+    done = progress['scraped'] + progress['failed']
+    print(f"\r📥 {done}/{progress['to_scrape']} scraped ({progress['failed']} failed)",
+          end="", file=sys.stderr, flush=True)
+
+
+async def main(args):
+    if args.file == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.file, encoding="utf-8-sig") as f:
+            text = f.read()
+    urls, invalid = parse_urls(text)
+    for link in invalid:
+        print(f"⚠️ Not a Digikala product link: {link}")
+
+    db = PriceDatabase(**DATABASE_CONFIG)
+    async_db = AsyncFacade(db, 'db', max_workers=1)
+    scraper = TieredFetcher(DigikalaScraper(**SCRAPER_CONFIG), **FETCHER_CONFIG,
+                            rate_limiter=create_rate_limiter(**RATE_LIMIT_CONFIG))
+    importer = ProductImporter(
+        async_db, scraper,
+        concurrency=args.concurrency,
+        next_check_in=SCHEDULER_CONFIG["check_interval"],
+        on_progress=None if args.quiet else show_progress
+    )
+    try:
+        result = await importer.run(urls, invalid)
+        if not args.quiet:
+            print(file=sys.stderr)
+    finally:
+        await scraper.close()
+        async_db.shutdown(wait=True)
+        db.close()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result['status'] == 'done' else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import Digikala products in bulk")
+    parser.add_argument("file", help="Text or CSV file with product links ('-' for stdin)")
+    parser.add_argument("--concurrency", type=int, default=SCHEDULER_CONFIG.get("max_workers", 4),
+                        help="Products scraped at the same time")
+    parser.add_argument("--quiet", action="store_true", help="Do not show progress")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -7,7 +7,13 @@ try:
         EMAIL_CONFIG, 
         BASISCORE_CONFIG, 
         SCHEDULER_CONFIG, 
+        SCRAPER_CONFIG,
+        FETCHER_CONFIG,
+        RATE_LIMIT_CONFIG,
+        OUTBOX_CONFIG,
         DATABASE_CONFIG,
+        WORKER_CONFIG,
+        SCHEDULER_PROCESS_CONFIG,
         BASISCORE_PATH
     )
 except ImportError:
@@ -20,170 +26,319 @@ sys.path.insert(0, BASISCORE_PATH)
 
 import json
 import asyncio
+import atexit
+import subprocess
 import threading
 import time
 from bclib import edge
 from price_monitor.scheduler import PriceScheduler
+from price_monitor.control import SchedulerControl, SchedulerClient, publish_outbox_gauges
+from price_monitor.executors import AsyncFacade
 from price_monitor.database import PriceDatabase
+from price_monitor.timeutils import utc_now
 from price_monitor.notifier import EmailNotifier
-from price_monitor.scraper import DigikalaScraper
+from price_monitor.scraper import DigikalaScraper, TieredFetcher
+from price_monitor.ratelimit import create_rate_limiter
+from price_monitor.importer import ProductImporter, parse_urls
+from price_monitor.dashboard import DashboardCache
+from price_monitor.api import (
+    parse_status_query, parse_history_query, history_rows, iter_json_object, HISTORY_COLUMNS,
+    read_import_text
+)
+from price_monitor.downsample import downsample
+from price_monitor import metrics
 
 # BasisCore Edge configuration
 app = edge.from_options(BASISCORE_CONFIG)
 
 # Initialize components
+SCHEDULER_MODE = SCHEDULER_PROCESS_CONFIG["mode"]
+if SCHEDULER_MODE not in ("thread", "process", "external"):
+    raise ValueError(f"Unknown scheduler mode: {SCHEDULER_MODE}")
+
 db = PriceDatabase(**DATABASE_CONFIG)
-scraper = DigikalaScraper()
-notifier = EmailNotifier(**EMAIL_CONFIG)
-scheduler = PriceScheduler(db, scraper, notifier, **SCHEDULER_CONFIG)
+# Used by the scheduler in thread mode and by /import
+scraper = TieredFetcher(DigikalaScraper(**SCRAPER_CONFIG), **FETCHER_CONFIG,
+                        rate_limiter=create_rate_limiter(**RATE_LIMIT_CONFIG))
+if SCHEDULER_MODE == "thread":
+    notifier = EmailNotifier(**EMAIL_CONFIG)
+    scheduler = PriceScheduler(db, scraper, notifier, outbox_options=OUTBOX_CONFIG,
+                               run_checks=not WORKER_CONFIG["enabled"], **SCHEDULER_CONFIG)
+    control = SchedulerControl(
+        scheduler,
+        poll_interval=SCHEDULER_PROCESS_CONFIG["poll_interval"],
+        status_interval=SCHEDULER_PROCESS_CONFIG["status_interval"]
+    )
+else:
+    # The scheduler runs in its own process (run_scheduler.py)
+    scheduler = None
+scheduler_client = SchedulerClient(db, SCHEDULER_PROCESS_CONFIG["status_interval"])
+import_db = AsyncFacade(db, 'import', max_workers=1)
+dashboard = DashboardCache(db)
+# Recent bulk imports by id; finished ones beyond the last 20 are forgotten
+imports = {}
+MAX_IMPORTS = 20
+
+
+def scheduler_status() -> dict:
+    """Scheduler stats: live in thread mode, as last published by the scheduler process otherwise"""
+    if scheduler is not None:
+        return scheduler.status()
+    published = scheduler_client.status()
+    if published is None:
+        return {"running": False}
+    return dict(published['status'], pid=published['pid'],
+                updated_at=published['updated_at'], stale=published['stale'])
+
+
+def wake_add_jobs():
+    """Let the scheduler pick up a new /add job right away"""
+    if scheduler is not None:
+        scheduler.wake_add_jobs()
+    else:
+        scheduler_client.send('add_jobs')
+
 
 @app.web_action(app.url(""))
 def home(context: edge.WebContext):
     """صفحه اصلی: نمایش تمام محصولات تحت نظارت"""
-    products = db.get_all_products()
-
-    html = """
-    <!DOCTYPE html>
-    <html lang="fa" dir="rtl">
-    <head>
-        <meta charset="UTF-8">
-        <title>نظارت قیمت دیجیکالا</title>
-        <script src="https://cdn.tailwindcss.com"></script>
-        <style>
-            body { background-color: #f8f9fb; }
-            .card { transition: transform 0.2s, box-shadow 0.2s; }
-            .card:hover { transform: translateY(-3px); box-shadow: 0 8px 20px rgba(0,0,0,0.1); }
-            .fade-in { animation: fadeIn 0.5s ease-in-out; }
-            @keyframes fadeIn { from {opacity: 0;} to {opacity: 1;} }
-        </style>
-    </head>
-    <body class="font-sans bg-gray-50">
-        <div class="max-w-5xl mx-auto py-10 px-4">
-            <h1 class="text-3xl font-bold text-[#e6123d] mb-8 flex items-center gap-2">
-                🛒 نظارت قیمت محصولات دیجیکالا
-            </h1>
-            
-            <div class="bg-white shadow-sm rounded-2xl p-6 mb-10 border border-gray-200">
-                <h2 class="text-xl font-semibold mb-4 text-gray-700">افزودن محصول جدید</h2>
-                <form action="/add" method="post" class="flex flex-col sm:flex-row gap-3">
-                    <input type="text" name="url" placeholder="لینک محصول دیجیکالا"
-                        class="flex-1 p-3 border border-gray-300 rounded-xl focus:ring-2 focus:ring-[#e6123d] focus:border-[#e6123d]" required>
-                    <button type="submit"
-                        class="bg-[#e6123d] text-white px-6 py-3 rounded-xl hover:bg-[#c50f33] transition">
-                        افزودن
-                    </button>
-                </form>
-                <p class="text-sm text-gray-500 mt-3">🔁 بررسی خودکار هر دقیقه انجام می‌شود.</p>
-            </div>
-            
-            <h2 class="text-2xl font-semibold text-gray-800 mb-4">محصولات در حال نظارت</h2>
-    """
-
-    if products:
-        html += '<div class="grid gap-4 sm:grid-cols-2 lg:grid-cols-3">'
-        for prod in products:
-            label_html = ""
-            price_change_html = ""
-
-            # بررسی تغییر قیمت
-            if prod.get("price_dropped"):
-                label_html = """
-                <span class="inline-block bg-green-100 text-green-800 text-xs font-semibold px-2 py-1 rounded-full mb-2">
-                    📉 کاهش قیمت!
-                </span>
-                """
-                price_change_html = f"""
-                    <p class="text-sm text-gray-500 line-through mb-1">
-                        قیمت قبل: {prod['old_price']:,}ریال
-                    </p>
-                """
-            elif prod.get("price_increased"):
-                label_html = """
-                <span class="inline-block bg-red-100 text-red-800 text-xs font-semibold px-2 py-1 rounded-full mb-2">
-                    📈 افزایش قیمت!
-                </span>
-                """
-                price_change_html = f"""
-                    <p class="text-sm text-gray-500 line-through mb-1">
-                        قیمت قبل: {prod['old_price']:,} ریال
-                    </p>
-                """
-
-            html += f"""
-            <div class="card bg-white rounded-2xl shadow-sm border border-gray-200 p-5 fade-in">
-                {label_html}
-                <h3 class="text-lg font-semibold text-gray-800 mb-2">{prod['name']}</h3>
-                <p class="text-sm text-gray-600 mb-1">قیمت فعلی:</p>
-                <p class="text-xl font-bold text-[#e6123d] mb-2">{prod['current_price']:,}ریال</p>
-                {price_change_html}
-                <p class="text-sm text-gray-600 mb-1">
-                    کمترین قیمت: <span class="font-semibold">{prod['lowest_price']:,}ریال</span>
-                </p>
-                <p class="text-xs text-gray-500 mb-3">آخرین بررسی: {prod['last_checked']}</p>
-                <a href="{prod['url']}" target="_blank"
-                class="inline-block text-center w-full bg-[#e6123d] text-white py-2 rounded-xl hover:bg-[#c50f33] transition">
-                مشاهده در دیجیکالا
-                </a>
-            </div>
-            """
-        html += "</div>"
-
+    if_none_match = context.cms.get('request', {}).get('if-none-match')
+    etag = dashboard.check_not_modified(if_none_match)
+    if etag is None:
+        etag, html = dashboard.render()
     else:
-        html += """
-        <div class="bg-yellow-50 border border-yellow-200 rounded-xl p-5 text-center text-yellow-800">
-            هنوز هیچ محصولی اضافه نشده است 🙁<br>
-            لطفاً لینک یک محصول دیجیکالا را وارد کنید تا نظارت آغاز شود.
-        </div>
-        """
-
-    html += """
-        </div>
-    </body>
-    </html>
-    """
-    return html
+        context.status_code = edge.HttpStatusCodes.NOT_MODIFIED
+        html = ""
 
+    context.add_header('ETag', etag)
+    context.add_header('Cache-Control', 'no-cache')
+    return html
 
 
 @app.web_action(app.url("add"))
-async def add_product(context: edge.WebContext):
-    """Add a new product to monitor"""
-    
+def add_product(context: edge.WebContext):
+    """
+    Queue a new product to monitor
+
+    The product is saved as a pending job and scraped in the background by
+    the scheduler, so the request returns right away (202) with the job id.
+    Clients sending `Accept: application/json` get the job as JSON.
+    """
     url = context.cms.get('form', {}).get('url')
+    wants_json = 'application/json' in (context.cms.get('request', {}).get('accept') or '')
+    if wants_json:
+        context.mime = edge.HttpMimeTypes.JSON
+    
+    if not url or 'digikala.com/product/' not in url:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return json.dumps({"error": "invalid url"}) if wants_json else "<h1>لینک نامعتبر</h1>"
     
-    if url and 'digikala.com/product/' in url:
-        print(f"🔍 Scraping product: {url}")
-        
-        # ✅ Await the async scraper
-        product_info = await scraper.scrape_product(url)
-        
-        if product_info:
-            success = db.add_product(
-                url=url,
-                name=product_info['name'],
-                price=product_info['price']
-            )
-            
-            if success:
-                return f"<h1>محصول اضافه شد: {product_info['name']}</h1>"
-            else:
-                return "<h1>این محصول قبلاً اضافه شده است</h1>"
-        else:
-            return "<h1>خطا در دریافت اطلاعات محصول</h1>"
+    job = db.enqueue_add_job(url.strip())
+    if job is None:
+        if wants_json:
+            return json.dumps({"status": "exists", "url": url}, ensure_ascii=False)
+        return "<h1>این محصول قبلاً اضافه شده است</h1>"
     
-    return "<h1>لینک نامعتبر</h1>"
+    print(f"📝 Queued product: {url}")
+    wake_add_jobs()
+    status_url = f"/add/status?id={job['id']}"
+    context.status_code = edge.HttpStatusCodes.ACCEPTED
+    if wants_json:
+        return json.dumps(dict(job, status_url=status_url), ensure_ascii=False)
+    return (f"<h1>محصول در صف افزودن قرار گرفت</h1>"
+            f"<p>اطلاعات محصول تا چند لحظه دیگر دریافت می‌شود. "
+            f"<a href=\"{status_url}\">وضعیت</a> | <a href=\"/\">بازگشت به داشبورد</a></p>")
+
+
+@app.web_action(app.url("add/status"))
+def add_status(context: edge.WebContext):
+    """Status of an /add job: pending, running, done (with name and price) or failed"""
+    context.mime = edge.HttpMimeTypes.JSON
+    job_id = context.cms.get('query', {}).get('id') or ''
+    job = db.get_add_job(int(job_id)) if job_id.isdigit() else None
+    if job is None:
+        context.status_code = edge.HttpStatusCodes.NOT_FOUND
+        return json.dumps({"error": f"unknown job: {job_id}"}, ensure_ascii=False)
+    return json.dumps(job, ensure_ascii=False)
+
+
+@app.web_action(app.url("import"))
+async def import_products(context: edge.WebContext):
+    """
+    Start a bulk import of product links in the background
+
+    Accepts the `urls` form field (one link per line or CSV), uploaded
+    text/CSV files or a JSON list. Answers 202 with the import's progress;
+    follow it at /import/status?id=<id>.
+    """
+    context.mime = edge.HttpMimeTypes.JSON
+    try:
+        urls, invalid = parse_urls(read_import_text(context.cms))
+    except ValueError as e:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+    importer = ProductImporter(
+        import_db, scraper,
+        concurrency=SCHEDULER_CONFIG.get("max_workers", 4),
+        next_check_in=SCHEDULER_CONFIG.get("check_interval", 60)
+    )
+    imports[importer.id] = (importer, asyncio.ensure_future(importer.run(urls, invalid)))
+    for job_id in [job_id for job_id, (_, task) in imports.items() if task.done()][:-MAX_IMPORTS]:
+        del imports[job_id]
+
+    context.status_code = edge.HttpStatusCodes.ACCEPTED
+    return json.dumps(dict(importer.progress, status_url=f"/import/status?id={importer.id}"),
+                      ensure_ascii=False)
+
+
+@app.web_action(app.url("import/status"))
+def import_status(context: edge.WebContext):
+    """Progress of one bulk import (?id=...), or of all recent ones"""
+    context.mime = edge.HttpMimeTypes.JSON
+    job_id = context.cms.get('query', {}).get('id')
+    if not job_id:
+        return json.dumps([importer.progress for importer, _ in imports.values()], ensure_ascii=False)
+
+    job = imports.get(int(job_id)) if job_id.isdigit() else None
+    if job is None:
+        context.status_code = edge.HttpStatusCodes.NOT_FOUND
+        return json.dumps({"error": f"unknown import: {job_id}"}, ensure_ascii=False)
+    return json.dumps(job[0].progress, ensure_ascii=False)
 
 
 @app.web_action(app.url("status"))
 def status(context: edge.WebContext):
-    """API endpoint to get status as JSON"""
-    products = db.get_all_products()
-    # context.response.type = edge.ResponseTypes.JSON
-    return json.dumps({
-        "total_products": len(products),
-        "products": products,
-        "last_check": scheduler.last_check_time
-    }, ensure_ascii=False)
+    """
+    API endpoint to get status as JSON
+
+    Query parameters: limit, cursor (the previous page's next_cursor),
+    fields=url,current_price,... and since=<timestamp> (changed=1 to only
+    get price changes). Scheduler stats are included on the first page.
+    """
+    context.mime = edge.HttpMimeTypes.JSON
+    try:
+        options = parse_status_query(context.cms.get('query', {}))
+        server_time = utc_now()
+        products = db.get_products_page(**options)
+    except ValueError as e:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+    full_page = len(products) == options['limit']
+    envelope = {
+        "total_products": db.count_products(),
+        "next_cursor": products[-1]['id'] if full_page else None,
+        "server_time": server_time.isoformat(sep=' ')
+    }
+    if not options['after_id']:
+        envelope.update(scheduler_status())
+        envelope.update({
+            "dashboard": dashboard.stats(),
+            "outbox": db.get_outbox_stats()
+        })
+    return "".join(iter_json_object(envelope, "products", products))
+
+
+@app.web_action(app.url("history"))
+def history(context: edge.WebContext):
+    """
+    API endpoint to get a product's price history for charts
+
+    Query parameters: url, start, end (UTC), points (target point count)
+    and method (minmax or lttb). Rows follow the order in `columns`.
+    """
+    context.mime = edge.HttpMimeTypes.JSON
+    try:
+        options = parse_history_query(context.cms.get('query', {}))
+    except ValueError as e:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+    series = db.get_price_history_range(options['url'], options['start'], options['end'])
+    points = downsample(series['points'], options['points'], options['method'])
+    envelope = {
+        "url": options['url'],
+        "resolution": series['resolution'],
+        "method": options['method'],
+        "source_points": len(series['points']),
+        "columns": HISTORY_COLUMNS[options['method']]
+    }
+    return "".join(iter_json_object(envelope, "points", history_rows(points, options['method'])))
+
+
+@app.web_action(app.url("metrics"))
+def metrics_endpoint(context: edge.WebContext):
+    """Prometheus metrics (text exposition format)"""
+    context.mime = metrics.CONTENT_TYPE
+    if scheduler is None:
+        # Sweeps, fetches and emails happen in the scheduler process, which publishes its metrics
+        published = scheduler_client.status()
+        return (published or {}).get('metrics') or ""
+    publish_outbox_gauges(db.get_outbox_stats())
+    return metrics.REGISTRY.render()
+
+
+@app.web_action(app.url("scheduler"))
+def scheduler_info(context: edge.WebContext):
+    """Live status of the scheduler (thread or separate process)"""
+    context.mime = edge.HttpMimeTypes.JSON
+    return json.dumps(dict(scheduler_status(), mode=SCHEDULER_MODE), ensure_ascii=False, default=str)
+
+
+@app.web_action(app.url("scheduler/control"))
+def scheduler_control(context: edge.WebContext):
+    """
+    Send a command to the scheduler: command=check_now, pause or resume
+
+    The command is executed by the scheduler within a second; ?id=<id>
+    shows whether it was done.
+    """
+    context.mime = edge.HttpMimeTypes.JSON
+    query = context.cms.get('query', {})
+    command_id = query.get('id') or ''
+    if command_id:
+        command = scheduler_client.command_status(int(command_id)) if command_id.isdigit() else None
+        if command is None:
+            context.status_code = edge.HttpStatusCodes.NOT_FOUND
+            return json.dumps({"error": f"unknown command: {command_id}"})
+        return json.dumps(command, ensure_ascii=False)
+
+    name = context.cms.get('form', {}).get('command') or query.get('command')
+    try:
+        command_id = scheduler_client.send(name)
+    except ValueError as e:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    context.status_code = edge.HttpStatusCodes.ACCEPTED
+    return json.dumps({"id": command_id, "command": name, "status": "pending",
+                       "status_url": f"/scheduler/control?id={command_id}"})
+
+
+@app.web_action(app.url("priority"))
+def set_priority(context: edge.WebContext):
+    """Pin a product's check interval in seconds (empty interval = adaptive)"""
+    form = context.cms.get('form', {})
+    url = form.get('url')
+    interval = form.get('interval')
+    
+    if not url:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return "<h1>لینک نامعتبر</h1>"
+    
+    min_interval = SCHEDULER_CONFIG.get("min_interval", 60)
+    interval = (interval or '').strip()
+    try:
+        seconds = int(interval) if interval else None
+        valid = seconds is None or seconds >= min_interval
+    except ValueError:
+        valid = False
+    if not valid:
+        context.status_code = edge.HttpStatusCodes.BAD_REQUEST
+        return f"<h1>فاصله بررسی باید عددی حداقل {min_interval} ثانیه یا خالی باشد</h1>"
+    if db.set_check_interval_override(url, seconds):
+        return f"<h1>فاصله بررسی تنظیم شد: {seconds or 'تطبیقی'}</h1>"
+    return "<h1>محصول پیدا نشد</h1>"
 
 
 def run_scheduler_later():
@@ -191,12 +346,23 @@ def run_scheduler_later():
     time.sleep(5)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.run_until_complete(scheduler.start())
+    loop.run_until_complete(control.run_scheduler())
 
 
-# Start scheduler in background thread
-scheduler_thread = threading.Thread(target=run_scheduler_later, daemon=True)
-scheduler_thread.start()
+if SCHEDULER_MODE == "thread":
+    # Start scheduler in background thread
+    scheduler_thread = threading.Thread(target=run_scheduler_later, daemon=True)
+    scheduler_thread.start()
+elif SCHEDULER_MODE == "process":
+    # Sweeps (and Chromium) run in a child process, so they cannot slow down web requests.
+    # A fresh interpreter, not multiprocessing: spawning would re-import (and re-run) this script.
+    scheduler_process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_scheduler.py")],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    atexit.register(scheduler_process.terminate)
+else:
+    print("ℹ️ Scheduler mode 'external': start it with python run_scheduler.py")
 
 print("✅ Digikala Price Monitor started!")
 print("📊 Web interface: http://127.0.0.1:1026")
@@ -4,8 +4,8 @@ A system to monitor product prices on Digikala and send email notifications for
 """
 
 from .database import PriceDatabase
-from .scraper import DigikalaScraper
+from .scraper import DigikalaScraper, TieredFetcher
 from .notifier import EmailNotifier
 from .scheduler import PriceScheduler
 
-__all__ = ['PriceDatabase', 'DigikalaScraper', 'EmailNotifier', 'PriceScheduler']
\ No newline at end of file
+__all__ = ['PriceDatabase', 'DigikalaScraper', 'TieredFetcher', 'EmailNotifier', 'PriceScheduler']
\ No newline at end of file
@@ -0,0 +1,156 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .downsample import METHODS
+from .timeutils import utc_now
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+DEFAULT_HISTORY_DAYS = 30
+DEFAULT_HISTORY_POINTS = 200
+MAX_HISTORY_POINTS = 2000
+
+# Column order of /history rows for each downsampling method
+HISTORY_COLUMNS = {
+    'minmax': ('time', 'open', 'close', 'min', 'max', 'count'),
+    'lttb': ('time', 'close'),
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO timestamp ("2024-05-01T12:00:00" or with a space) or Unix seconds
+
+    The result is naive UTC: "Z" and offsets are converted, timestamps
+    without an offset are taken as UTC already.
+    """
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+
+def parse_int(value: Optional[str], default: int, minimum: int = 0,
+              maximum: Optional[int] = None) -> int:
+    if value in (None, ''):
+        return default
+    number = int(value)
+    if number < minimum:
+        raise ValueError(f"{value} is below {minimum}")
+    return min(number, maximum) if maximum is not None else number
+
+
+def parse_status_query(query: Dict) -> Dict:
+    """
+    Turn /status query parameters into get_products_page() arguments
+
+    Supported parameters: limit, cursor, fields (comma separated),
+    since (UTC timestamp) and changed=1 (with since: price changes only).
+
+    Raises:
+        ValueError: If a parameter is malformed
+    """
+    fields = query.get('fields')
+    since = query.get('since')
+    return {
+        'limit': parse_int(query.get('limit'), DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE),
+        'after_id': parse_int(query.get('cursor'), 0),
+        'fields': [f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+        'since': parse_timestamp(since) if since else None,
+        'changed_only': query.get('changed') in ('1', 'true'),
+    }
+
+
+def parse_history_query(query: Dict) -> Dict:
+    """
+    Read the /history query parameters
+
+    Supported parameters: url (required), start and end (UTC timestamps,
+    default the last 30 days), points (target point count) and method
+    ("minmax" or "lttb").
+
+    Raises:
+        ValueError: If a parameter is missing or malformed
+    """
+    url = query.get('url')
+    if not url:
+        raise ValueError("url is required")
+    end = parse_timestamp(query['end']) if query.get('end') else utc_now()
+    start = (parse_timestamp(query['start']) if query.get('start')
+             else end - timedelta(days=DEFAULT_HISTORY_DAYS))
+    if start >= end:
+        raise ValueError("start must be before end")
+    method = query.get('method') or 'minmax'
+    if method not in METHODS:
+        raise ValueError(f"method must be one of: {', '.join(METHODS)}")
+    return {
+        'url': url,
+        'start': start,
+        'end': end,
+        'points': parse_int(query.get('points'), DEFAULT_HISTORY_POINTS, 2, MAX_HISTORY_POINTS),
+        'method': method,
+    }
+
+
+def read_import_text(cms: Dict) -> str:
+    """
+    Collect the product links posted to /import
+
+    Links may come as the `urls` form field (pasted text or CSV), as
+    uploaded files, or as a JSON body (a list of links or {"urls": [...]}).
+
+    Raises:
+        ValueError: If nothing was posted
+    """
+    texts = []
+    value = cms.get('form', {}).get('urls')
+    if value:
+        texts.extend(value if isinstance(value, list) else [value])
+    for upload in cms.get('files', []):
+        texts.append(upload['content'].decode('utf-8-sig', errors='replace'))
+
+    body = cms.get('request', {}).get('body')
+    if not texts and body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = body
+        if isinstance(payload, dict):
+            payload = payload.get('urls', [])
+        texts.append("\n".join(payload) if isinstance(payload, list) else str(payload))
+
+    if not any(texts):
+        raise ValueError("no product links were posted")
+    return "\n".join(texts)
+
+
+def history_rows(points: List[Dict], method: str) -> List[List]:
+    """Compact points into lists in HISTORY_COLUMNS order"""
+    columns = HISTORY_COLUMNS[method]
+    return [[point[column] for column in columns] for point in points]
+
+
+def iter_json_object(envelope: Dict, key: str, items: Iterable) -> Iterator[str]:
+    """
+    Encode `envelope` plus a `key: [items]` list as JSON, piece by piece
+
+    Items are serialized one at a time, so a long list never has to exist
+    as one large intermediate structure next to its encoded form.
+    """
+    yield '{'
+    for name, value in envelope.items():
+        yield f'{json.dumps(name)}: {json.dumps(value, ensure_ascii=False, default=str)}, '
+    yield f'{json.dumps(key)}: ['
+    for index, item in enumerate(items):
+        if index:
+            yield ', '
+        yield json.dumps(item, ensure_ascii=False, default=str)
+    yield ']}'
@@ -9,7 +9,12 @@ EMAIL_CONFIG = {
     "smtp_port": 587,
     "sender_email": "YOUR_EMAIL@gmail.com",  # ایمیل خودتان
     "sender_password": "YOUR_APP_PASSWORD",   # رمز اپلیکیشن Gmail
-    "recipient_email": "YOUR_EMAIL@gmail.com" # ایمیل دریافت‌کننده
+    "recipient_email": "YOUR_EMAIL@gmail.com", # ایمیل دریافت‌کننده
+    "keepalive": 60,          # اتصال SMTP باز می‌ماند و بعد از این مدت بیکاری بررسی می‌شود
+    # "off": یک ایمیل برای هر محصول، "sweep": یک ایمیل برای هر دور بررسی،
+    # "window": یک ایمیل برای تمام کاهش‌های هر digest_window ثانیه
+    "digest_mode": "off",
+    "digest_window": 600
 }
 
 # BasisCore Configuration
@@ -22,12 +27,106 @@ BASISCORE_CONFIG = {
 
 # Scheduler Configuration
 SCHEDULER_CONFIG = {
-    "check_interval": 60  # بررسی هر 60 ثانیه
+    "check_interval": 60,  # بررسی هر 60 ثانیه
+    "max_workers": 4,      # تعداد محصولاتی که همزمان بررسی می‌شوند
+    "flush_size": 25,      # تعداد قیمت‌هایی که در یک تراکنش ذخیره می‌شوند
+    "prune_interval": 3600, # فاصله اجرای پاک‌سازی تاریخچه قدیمی (ثانیه)
+    "email_workers": 2,     # تعداد threadهای ارسال ایمیل
+    # زمان‌بندی تطبیقی: محصولاتی که قیمتشان تغییر نمی‌کند کمتر بررسی می‌شوند
+    "adaptive": True,
+    "min_interval": 60,         # کوتاه‌ترین فاصله بررسی هر محصول (ثانیه)
+    "max_interval": 21600,      # طولانی‌ترین فاصله بررسی هر محصول (6 ساعت)
+    "backoff_factor": 1.5       # ضریب افزایش فاصله وقتی قیمت تغییر نکرده
+}
+
+# Scraper Configuration
+SCRAPER_CONFIG = {
+    "pool_size": 2,            # تعداد صفحات مرورگر که همزمان باز می‌شوند
+    "pages_per_context": 50,   # بازسازی context بعد از این تعداد صفحه
+    "max_memory_mb": 512,      # بازسازی context اگر حافظه JS از این مقدار بیشتر شود
+    "headless": True,
+    # حالت سبک: دانلود نکردن تصاویر، فونت‌ها، ویدیوها و اسکریپت‌های سایت‌های دیگر
+    "lean_mode": False,
+    "blocked_resource_types": ["image", "font", "media"],
+    "allowed_hosts": ["digikala.com"],   # دامنه‌های مجاز (زیردامنه‌ها هم شامل می‌شوند)
+    "blocked_url_patterns": [],          # regex آدرس‌هایی که همیشه مسدود می‌شوند
+    "allowed_url_patterns": []           # regex آدرس‌هایی که هرگز مسدود نمی‌شوند
+}
+
+# Fetcher Configuration (مسیر سریع HTTP قبل از باز کردن مرورگر)
+FETCHER_CONFIG = {
+    "http_enabled": True,
+    "api_url_template": "https://api.digikala.com/v2/product/{product_id}/",
+    "http_timeout": 10,
+    "price_divisor": 10,  # قیمت API به ریال است، صفحه به تومان نمایش می‌دهد
+    "cache_ttl": 60,      # نتیجه هر محصول تا این مدت (ثانیه) دوباره استفاده می‌شود
+    "cache_size": 256     # حداکثر تعداد محصولات در حافظه موقت
+}
+
+# Rate Limit Configuration
+# محدودیت تعداد درخواست به هر سایت؛ با خطا کم و با موفقیت به تدریج زیاد می‌شود
+RATE_LIMIT_CONFIG = {
+    "enabled": True,
+    "rate": 2.0,               # تعداد درخواست در ثانیه در شروع (برای هر سایت)
+    "burst": 5,                # تعداد درخواست‌هایی که می‌توانند یکجا ارسال شوند
+    "min_rate": 0.2,           # کمترین سرعت بعد از خطاهای پشت سر هم
+    "max_rate": 10.0,          # بیشترین سرعت وقتی همه درخواست‌ها موفق هستند
+    "increase_step": 0.05,     # افزایش سرعت بعد از هر درخواست موفق
+    "decrease_factor": 0.5,    # ضریب کاهش سرعت بعد از خطا، timeout یا captcha
+    # توقف موقت درخواست‌ها وقتی بیش از نیمی از 20 درخواست اخیر ناموفق بوده‌اند
+    "failure_threshold": 0.5,
+    "window": 20,
+    "cooldown": 60,            # مدت توقف (ثانیه)؛ با شکست دوباره دو برابر می‌شود
+    "max_cooldown": 900
+}
+
+# Notification Outbox Configuration
+# کاهش قیمت‌ها ابتدا در دیتابیس ذخیره و سپس در پس‌زمینه ارسال می‌شوند
+OUTBOX_CONFIG = {
+    "poll_interval": 10,          # فاصله بررسی صف ایمیل‌ها (ثانیه)
+    "max_attempts": 8,            # تعداد تلاش قبل از رها کردن ایمیل
+    "base_backoff": 30,           # تأخیر اولین تلاش مجدد؛ هر بار دو برابر می‌شود
+    "max_backoff": 3600,
+    "rate_limit_per_minute": 20   # حداکثر تعداد ایمیل در دقیقه
+}
+
+# Scheduler Process Configuration
+# "thread": زمان‌بندی داخل همان پروسه وب سرور اجرا می‌شود
+# "process": main.py زمان‌بندی را در یک پروسه جدا اجرا می‌کند (وب سرور در حین بررسی‌ها کند نمی‌شود)
+# "external": زمان‌بندی جداگانه با python run_scheduler.py اجرا می‌شود
+SCHEDULER_PROCESS_CONFIG = {
+    "mode": "thread",
+    "poll_interval": 1.0,    # فاصله بررسی دستورات (بررسی فوری، توقف، ادامه) به ثانیه
+    "status_interval": 5.0   # فاصله به‌روزرسانی وضعیت زمان‌بندی برای /status (ثانیه)
+}
+
+# Worker Configuration
+# با "enabled": True بررسی قیمت‌ها به پروسه‌های run_workers.py سپرده می‌شود
+WORKER_CONFIG = {
+    "enabled": False,
+    "processes": 2,               # تعداد پروسه‌های worker روی هر سیستم
+    "backend": "sqlite",          # "sqlite" یا "redis" (فقط رزروها)؛ در هر دو حالت همه روی یک سیستم
+    "redis_url": "redis://localhost:6379/0",
+    "batch_size": 10,             # تعداد محصولاتی که هر worker یک‌جا برمی‌دارد
+    "lease_seconds": 300,         # محصولات worker از کار افتاده بعد از این مدت آزاد می‌شوند
+    "poll_interval": 5            # مکث وقتی محصولی برای بررسی نیست (ثانیه)
 }
 
 # Database Configuration
 DATABASE_CONFIG = {
-    "db_path": "prices.db"
+    "db_path": "prices.db",
+    "busy_timeout": 30.0,   # ثانیه انتظار برای قفل نوشتن
+    "cache_size_kb": 16384,
+    "mmap_size_mb": 128,
+    # "compact": فقط هنگام تغییر قیمت ردیف جدید در تاریخچه ذخیره می‌شود
+    # (برای دیتابیس قدیمی یک بار python compact_history.py را اجرا کنید)
+    "history_mode": "compact",
+    # نگهداری داده‌ها: None یعنی هیچ داده‌ای حذف نشود. برای حذف خودکار تاریخچه خام و
+    # خلاصه‌های ساعتی قدیمی‌تر از این تعداد روز، مثلاً 30 و 365 بگذارید
+    # (خلاصه‌های روزانه همیشه نگه داشته می‌شوند؛ حذف قابل بازگشت نیست)
+    "raw_retention_days": None,      # مثلاً 30
+    "hourly_retention_days": None,   # مثلاً 365
+    "prune_batch_size": 1000
 }
 
 # BasisCore Path
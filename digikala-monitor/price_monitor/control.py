@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from .executors import AsyncFacade
+from .metrics import OUTBOX_ENTRIES, REGISTRY
+
+
+# Commands accepted by SchedulerControl; "add_jobs" is sent by /add to skip the job poll delay
+COMMANDS = ('check_now', 'pause', 'resume', 'add_jobs')
+
+# Meta key that keeps the pause across restarts (also read by worker processes)
+PAUSED_KEY = 'scheduler_paused'
+
+
+def publish_outbox_gauges(outbox_stats: Dict):
+    for status_name, count in outbox_stats.items():
+        OUTBOX_ENTRIES.labels(status=status_name).set(count)
+
+
+class SchedulerControl:
+    """Command and status channel of a PriceScheduler, through the database
+
+    Runs next to the scheduler on its event loop: every `poll_interval`
+    seconds it executes commands queued in `scheduler_commands` (by
+    SchedulerClient, e.g. from the web process) and every
+    `status_interval` seconds it publishes `scheduler.status()` and the
+    Prometheus metrics of this process to `scheduler_status`. SQLite is
+    already shared by every process, so no socket or extra service is
+    needed.
+    """
+
+    def __init__(self, scheduler, poll_interval: float = 1.0, status_interval: float = 5.0):
+        """
+        Initialize control channel
+
+        Args:
+            scheduler: PriceScheduler to control
+            poll_interval: Seconds between checks for new commands
+            status_interval: Seconds between status updates
+        """
+        self.scheduler = scheduler
+        # Own executor: control stays responsive while the scheduler's db queue is busy
+        self.db = AsyncFacade(scheduler.db, 'control', max_workers=1)
+        self.poll_interval = poll_interval
+        self.status_interval = status_interval
+        self.is_running = False
+        self._stopped = None
+
+    async def run_scheduler(self):
+        """Run the scheduler together with this channel until the scheduler stops"""
+        if await self.db.get_meta_value(PAUSED_KEY):
+            self.scheduler.pause()
+        task = asyncio.ensure_future(self.run())
+        try:
+            await self.scheduler.start()
+        finally:
+            self.stop()
+            await task
+            self.db.shutdown(wait=False)
+
+    async def run(self):
+        """Handle commands and publish the status until stop() is called"""
+        self.is_running = True
+        self._stopped = asyncio.Event()
+        next_publish = 0.0
+        while self.is_running:
+            try:
+                handled = await self._handle_commands()
+                if handled or time.monotonic() >= next_publish:
+                    await self.publish_status()
+                    next_publish = time.monotonic() + self.status_interval
+            except Exception as e:
+                print(f"❌ Scheduler control error: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        await self.publish_status()
+
+    def stop(self):
+        self.is_running = False
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def publish_status(self):
+        publish_outbox_gauges(await self.db.get_outbox_stats())
+        await self.db.save_scheduler_status(os.getpid(), self.scheduler.status(), REGISTRY.render())
+
+    async def _handle_commands(self) -> int:
+        commands = await self.db.get_pending_scheduler_commands()
+        for command in commands:
+            try:
+                result = await self._execute(command['command'])
+            except Exception as e:
+                await self.db.finish_scheduler_command(command['id'], 'failed', str(e))
+                print(f"❌ Scheduler command {command['command']} failed: {e}")
+            else:
+                await self.db.finish_scheduler_command(command['id'], 'done', result)
+        return len(commands)
+
+    async def _execute(self, command: str) -> str:
+        if command == 'check_now':
+            count = await self.scheduler.check_now()
+            return f"{count} products scheduled"
+        if command == 'pause':
+            self.scheduler.pause()
+            await self.db.set_meta_value(PAUSED_KEY, 1)
+            return "paused"
+        if command == 'resume':
+            self.scheduler.resume()
+            await self.db.set_meta_value(PAUSED_KEY, 0)
+            return "resumed"
+        if command == 'add_jobs':
+            self.scheduler.wake_add_jobs()
+            return "woken"
+        raise ValueError(f"Unknown command: {command}")
+
+
+class SchedulerClient:
+    """Sends commands to a SchedulerControl and reads its published status"""
+
+    def __init__(self, database, status_interval: float = 5.0):
+        """
+        Initialize client
+
+        Args:
+            database: PriceDatabase shared with the scheduler process
+            status_interval: The scheduler's status interval; a status older
+                than three intervals is reported as stale
+        """
+        self.db = database
+        self.status_interval = status_interval
+
+    def send(self, command: str) -> int:
+        """
+        Queue a command
+
+        Returns:
+            Command id, see command_status()
+
+        Raises:
+            ValueError: If the command is unknown
+        """
+        if command not in COMMANDS:
+            raise ValueError(f"command must be one of: {', '.join(COMMANDS)}")
+        return self.db.enqueue_scheduler_command(command)
+
+    def command_status(self, command_id: int) -> Optional[Dict]:
+        return self.db.get_scheduler_command(command_id)
+
+    def status(self) -> Optional[Dict]:
+        """
+        Latest published status
+
+        Returns:
+            Dict with 'pid', 'status', 'metrics', 'updated_at', 'age_seconds'
+            and 'stale', None if the scheduler never published one
+        """
+        published = self.db.get_scheduler_status()
+        if published is not None:
+            published['stale'] = published['age_seconds'] > 3 * self.status_interval
+        return published
@@ -0,0 +1,218 @@
+import threading
+import time
+from html import escape
+from typing import Dict, List, Optional, Tuple
+
+
+PAGE_HEAD = """
+    <!DOCTYPE html>
+    <html lang="fa" dir="rtl">
+    <head>
+        <meta charset="UTF-8">
+        <title>نظارت قیمت دیجیکالا</title>
+        <script src="https://cdn.tailwindcss.com"></script>
+        <style>
+            body { background-color: #f8f9fb; }
+            .card { transition: transform 0.2s, box-shadow 0.2s; }
+            .card:hover { transform: translateY(-3px); box-shadow: 0 8px 20px rgba(0,0,0,0.1); }
+            .fade-in { animation: fadeIn 0.5s ease-in-out; }
+            @keyframes fadeIn { from {opacity: 0;} to {opacity: 1;} }
+        </style>
+    </head>
+    <body class="font-sans bg-gray-50">
+        <div class="max-w-5xl mx-auto py-10 px-4">
+            <h1 class="text-3xl font-bold text-[#e6123d] mb-8 flex items-center gap-2">
+                🛒 نظارت قیمت محصولات دیجیکالا
+            </h1>
+
+            <div class="bg-white shadow-sm rounded-2xl p-6 mb-10 border border-gray-200">
+                <h2 class="text-xl font-semibold mb-4 text-gray-700">افزودن محصول جدید</h2>
+                <form action="/add" method="post" class="flex flex-col sm:flex-row gap-3">
+                    <input type="text" name="url" placeholder="لینک محصول دیجیکالا"
+                        class="flex-1 p-3 border border-gray-300 rounded-xl focus:ring-2 focus:ring-[#e6123d] focus:border-[#e6123d]" required>
+                    <button type="submit"
+                        class="bg-[#e6123d] text-white px-6 py-3 rounded-xl hover:bg-[#c50f33] transition">
+                        افزودن
+                    </button>
+                </form>
+                <p class="text-sm text-gray-500 mt-3">🔁 بررسی خودکار هر دقیقه انجام می‌شود.</p>
+            </div>
+
+            <h2 class="text-2xl font-semibold text-gray-800 mb-4">محصولات در حال نظارت</h2>
+    """
+
+EMPTY_STATE = """
+        <div class="bg-yellow-50 border border-yellow-200 rounded-xl p-5 text-center text-yellow-800">
+            هنوز هیچ محصولی اضافه نشده است 🙁<br>
+            لطفاً لینک یک محصول دیجیکالا را وارد کنید تا نظارت آغاز شود.
+        </div>
+        """
+
+PAGE_FOOT = """
+        </div>
+    </body>
+    </html>
+    """
+
+
+def render_product_card(prod: Dict) -> str:
+    """HTML card of one product"""
+    label_html = ""
+    price_change_html = ""
+
+    # بررسی تغییر قیمت
+    if prod.get("price_dropped"):
+        label_html = """
+                <span class="inline-block bg-green-100 text-green-800 text-xs font-semibold px-2 py-1 rounded-full mb-2">
+                    📉 کاهش قیمت!
+                </span>
+                """
+        price_change_html = f"""
+                    <p class="text-sm text-gray-500 line-through mb-1">
+                        قیمت قبل: {prod['old_price']:,}ریال
+                    </p>
+                """
+    elif prod.get("price_increased"):
+        label_html = """
+                <span class="inline-block bg-red-100 text-red-800 text-xs font-semibold px-2 py-1 rounded-full mb-2">
+                    📈 افزایش قیمت!
+                </span>
+                """
+        price_change_html = f"""
+                    <p class="text-sm text-gray-500 line-through mb-1">
+                        قیمت قبل: {prod['old_price']:,} ریال
+                    </p>
+                """
+
+    return f"""
+            <div class="card bg-white rounded-2xl shadow-sm border border-gray-200 p-5 fade-in">
+                {label_html}
+                <h3 class="text-lg font-semibold text-gray-800 mb-2">{escape(prod['name'])}</h3>
+                <p class="text-sm text-gray-600 mb-1">قیمت فعلی:</p>
+                <p class="text-xl font-bold text-[#e6123d] mb-2">{prod['current_price']:,}ریال</p>
+                {price_change_html}
+                <p class="text-sm text-gray-600 mb-1">
+                    کمترین قیمت: <span class="font-semibold">{prod['lowest_price']:,}ریال</span>
+                </p>
+                <p class="text-xs text-gray-500 mb-3">آخرین بررسی: {str(prod['last_checked'])[:19]} UTC</p>
+                <a href="{escape(prod['url'])}" target="_blank"
+                class="inline-block text-center w-full bg-[#e6123d] text-white py-2 rounded-xl hover:bg-[#c50f33] transition">
+                مشاهده در دیجیکالا
+                </a>
+            </div>
+            """
+
+
+def render_dashboard(products: List[Dict]) -> str:
+    """صفحه اصلی: نمایش تمام محصولات تحت نظارت"""
+    parts = [PAGE_HEAD]
+    if products:
+        parts.append('<div class="grid gap-4 sm:grid-cols-2 lg:grid-cols-3">')
+        parts.extend(render_product_card(prod) for prod in products)
+        parts.append("</div>")
+    else:
+        parts.append(EMPTY_STATE)
+    parts.append(PAGE_FOOT)
+    return "".join(parts)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches `etag`"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    plain = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any(
+        (tag[2:] if tag.startswith("W/") else tag) == plain for tag in candidates
+    )
+
+
+class DashboardCache:
+    """Renders the dashboard once per database data version
+
+    `PriceDatabase.get_data_version()` grows on every product write, so
+    the cached HTML is reused until the next sweep (or add/remove) changes
+    something. The ETag is derived from the version, letting polling
+    browsers revalidate with If-None-Match and get a 304 instead.
+    """
+
+    def __init__(self, database):
+        """
+        Initialize cache
+
+        Args:
+            database: PriceDatabase the products are read from
+        """
+        self.db = database
+        # Changes on restart, so a new template never matches an old ETag
+        self._instance = format(int(time.time()), "x")
+        self._lock = threading.Lock()
+        self._version = None
+        self._etag = None
+        self._html = None
+        self.requests = 0
+        self.not_modified = 0
+        self.hits = 0
+        self.renders = 0
+        self.last_render_ms = 0.0
+        self.total_render_ms = 0.0
+
+    def etag(self) -> str:
+        """ETag of the dashboard for the current data version"""
+        return self._etag_for(self.db.get_data_version())
+
+    def _etag_for(self, version: int) -> str:
+        return f'"{self._instance}-{version}"'
+
+    def check_not_modified(self, if_none_match: Optional[str]) -> Optional[str]:
+        """
+        Count a dashboard request and check the client's cached copy
+
+        Returns:
+            The current ETag if the client's copy is still fresh, None otherwise
+        """
+        etag = self.etag()
+        with self._lock:
+            self.requests += 1
+            if etag_matches(if_none_match, etag):
+                self.not_modified += 1
+                return etag
+        return None
+
+    def render(self) -> Tuple[str, str]:
+        """
+        Return the dashboard, rendering it only if the data changed
+
+        Returns:
+            (etag, html) tuple
+        """
+        with self._lock:
+            version = self.db.get_data_version()
+            if version == self._version:
+                self.hits += 1
+                return self._etag, self._html
+
+            started = time.perf_counter()
+            html = render_dashboard(self.db.get_all_products())
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self._version = version
+            self._etag = self._etag_for(version)
+            self._html = html
+            self.renders += 1
+            self.last_render_ms = elapsed
+            self.total_render_ms += elapsed
+            return self._etag, html
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'not_modified': self.not_modified,
+                'cache_hits': self.hits,
+                'renders': self.renders,
+                'hit_rate': (self.not_modified + self.hits) / self.requests if self.requests else 0.0,
+                'last_render_ms': self.last_render_ms,
+                'avg_render_ms': self.total_render_ms / self.renders if self.renders else 0.0,
+            }
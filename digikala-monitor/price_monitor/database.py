@@ -1,20 +1,182 @@
+import json
+import os
 import sqlite3
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
+
+from .metrics import STAGE_SECONDS
+from .timeutils import utc_now
+from .urls import clean_url, product_key
 
 
 class PriceDatabase:
-    """Manages SQLite database for price history"""
-    
-    def __init__(self, db_path: str = "prices.db"):
+    """Manages SQLite database for price history
+
+    Every thread keeps one long-lived connection (so prepared statements are
+    reused from the connection's statement cache) and the database runs in
+    WAL mode, letting web request threads read while the scheduler writes.
+    Writes take the write lock up front with BEGIN IMMEDIATE so concurrent
+    writers wait on busy_timeout instead of failing with "database is locked".
+    """
+
+    # Conservative bound on "?" placeholders per statement (older SQLite builds allow 999)
+    MAX_SQL_VARIABLES = 900
+
+    # Schema migrations in order; a database at user_version N has run the first N
+    MIGRATIONS = (
+        '_migrate_base_tables',
+        '_migrate_history_indexes',
+        '_migrate_history_runs',
+        '_migrate_rollups',
+        '_migrate_notification_outbox',
+        '_migrate_adaptive_schedule',
+        '_migrate_data_version',
+        '_migrate_status_indexes',
+        '_migrate_product_leases',
+        '_migrate_add_jobs',
+        '_migrate_scheduler_control',
+        '_migrate_product_keys',
+        '_migrate_remove_orphans',
+        '_migrate_utc_timestamps',
+    )
+
+    # Finished /add jobs and handled scheduler commands are kept this long for their status pages
+    FINISHED_JOB_RETENTION_DAYS = 7
+
+    # Columns read by get_all_products() and the lease queries, see _product_dict()
+    PRODUCT_COLUMNS = (
+        'id, url, name, current_price, lowest_price, last_checked, '
+        'next_check_at, check_interval, interval_override'
+    )
+
+    # Product columns that get_products_page() can project
+    PRODUCT_FIELDS = (
+        'id', 'url', 'name', 'current_price', 'lowest_price', 'last_checked',
+        'last_changed_at', 'next_check_at', 'check_interval', 'interval_override',
+    )
+
+    # Rollup tables and the strftime() format that truncates a UTC timestamp to their bucket
+    ROLLUPS = (
+        ('price_rollup_hourly', '%Y-%m-%d %H:00:00'),
+        ('price_rollup_daily', '%Y-%m-%d 00:00:00'),
+    )
+
+    def __init__(self, db_path: str = "prices.db", busy_timeout: float = 30.0,
+                 cache_size_kb: int = 16384, mmap_size_mb: int = 128,
+                 statement_cache_size: int = 256, history_mode: str = "full",
+                 raw_retention_days: Optional[int] = None,
+                 hourly_retention_days: Optional[int] = None,
+                 prune_batch_size: int = 1000):
+        """
+        Initialize database
+
+        Args:
+            db_path: Path of the SQLite file
+            busy_timeout: Seconds to wait for a lock held by another connection
+            cache_size_kb: Page cache size of each connection
+            mmap_size_mb: Memory-mapped I/O size (0 disables it)
+            statement_cache_size: Prepared statements kept per connection
+            history_mode: "full" stores a history row per check, "compact" only
+                when the price changes (repeats extend the current run)
+            raw_retention_days: Prune raw history older than this (None keeps all)
+            hourly_retention_days: Prune hourly rollups older than this (None keeps all)
+            prune_batch_size: Rows deleted per transaction while pruning
+        """
+        if history_mode not in ("full", "compact"):
+            raise ValueError(f"Unknown history_mode: {history_mode}")
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.statement_cache_size = statement_cache_size
+        self.history_mode = history_mode
+        self.raw_retention_days = raw_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.prune_batch_size = prune_batch_size
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._pid = os.getpid()
         self._create_tables()
-    
-    def _create_tables(self):
-        """Create necessary database tables"""
-        conn = sqlite3.connect(self.db_path)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        if self._pid != os.getpid():
+            # Forked child (e.g. a worker process): never reuse the parent's
+            # connections, SQLite handles must not cross fork()
+            self._local = threading.local()
+            self._connections = []
+            self._connections_lock = threading.Lock()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.statement_cache_size
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+            conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size_mb) * 1024 * 1024}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block inside a write transaction and yield a cursor"""
+        conn = self._connection()
         cursor = conn.cursor()
-        
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def close(self):
+        """Close the connections of all threads"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def _create_tables(self):
+        """Create necessary database tables and apply pending migrations
+
+        The schema version is kept in SQLite's `user_version`. Each entry of
+        MIGRATIONS moves the schema one version forward and runs in its own
+        transaction, so existing databases are upgraded in place.
+        """
+        conn = self._connection()
+        for version, name in enumerate(self.MIGRATIONS, start=1):
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+            with self._transaction() as cursor:
+                # Another process may have migrated while we waited for the lock
+                if cursor.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    continue
+                getattr(self, name)(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+            print(f"🗄️ Database migrated to version {version} ({name})")
+
+    def _migrate_base_tables(self, cursor: sqlite3.Cursor):
         # Products table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS products (
@@ -27,7 +189,7 @@ class PriceDatabase:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
         # Price history table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS price_history (
@@ -38,162 +200,1214 @@ class PriceDatabase:
                 FOREIGN KEY (product_id) REFERENCES products(id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def add_product(self, url: str, name: str, price: int) -> bool:
-        """Add a new product to monitor"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            now = datetime.now()
-            
+
+    def _migrate_history_indexes(self, cursor: sqlite3.Cursor):
+        # History lookups filter on product and read the newest rows first
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_history_product_checked
+            ON price_history (product_id, checked_at DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_last_checked
+            ON products (last_checked DESC)
+        ''')
+        cursor.execute('ANALYZE')
+
+    def _migrate_history_runs(self, cursor: sqlite3.Cursor):
+        # A history row is a run of identical observations from checked_at to last_seen_at
+        cursor.execute('ALTER TABLE price_history ADD COLUMN last_seen_at TIMESTAMP')
+        cursor.execute(
+            'ALTER TABLE price_history ADD COLUMN observation_count INTEGER NOT NULL DEFAULT 1'
+        )
+        cursor.execute('UPDATE price_history SET last_seen_at = checked_at')
+
+        # Runs are located by "newest row of a product"; id breaks same-second ties
+        cursor.execute('DROP INDEX IF EXISTS idx_price_history_product_checked')
+        cursor.execute('''
+            CREATE INDEX idx_price_history_product_checked
+            ON price_history (product_id, checked_at DESC, id DESC)
+        ''')
+
+    def _migrate_rollups(self, cursor: sqlite3.Cursor):
+        for table, bucket_format in self.ROLLUPS:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    product_id INTEGER NOT NULL,
+                    bucket_start TIMESTAMP NOT NULL,
+                    open_price INTEGER NOT NULL,
+                    close_price INTEGER NOT NULL,
+                    min_price INTEGER NOT NULL,
+                    max_price INTEGER NOT NULL,
+                    observation_count INTEGER NOT NULL,
+                    PRIMARY KEY (product_id, bucket_start)
+                ) WITHOUT ROWID
+            ''')
+
+            # Backfill from the existing raw history
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {table}
+                SELECT product_id, bucket,
+                       MAX(CASE WHEN first_rank = 1 THEN price END),
+                       MAX(CASE WHEN last_rank = 1 THEN price END),
+                       MIN(price), MAX(price), SUM(observation_count)
+                FROM (
+                    SELECT product_id, price, observation_count,
+                           strftime('{bucket_format}', checked_at) AS bucket,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY product_id, strftime('{bucket_format}', checked_at)
+                               ORDER BY checked_at, id
+                           ) AS first_rank,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY product_id, strftime('{bucket_format}', checked_at)
+                               ORDER BY checked_at DESC, id DESC
+                           ) AS last_rank
+                    FROM price_history
+                )
+                GROUP BY product_id, bucket
+            ''')
+
+        # Retention deletes the oldest raw rows first
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_history_checked
+            ON price_history (checked_at)
+        ''')
+
+    def _migrate_notification_outbox(self, cursor: sqlite3.Cursor):
+        # status: pending -> sending (claimed by a sender) -> sent, or dead after max attempts
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+            ON notification_outbox (status, next_attempt_at)
+        ''')
+
+    def _migrate_adaptive_schedule(self, cursor: sqlite3.Cursor):
+        # next_check_at is UTC like checked_at; NULL means "due now"
+        cursor.execute('ALTER TABLE products ADD COLUMN next_check_at TIMESTAMP')
+        cursor.execute('ALTER TABLE products ADD COLUMN check_interval INTEGER')
+        cursor.execute('ALTER TABLE products ADD COLUMN interval_override INTEGER')
+        cursor.execute('ALTER TABLE products ADD COLUMN last_changed_at TIMESTAMP')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_next_check
+            ON products (next_check_at)
+        ''')
+
+    def _migrate_data_version(self, cursor: sqlite3.Cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+
+    def _migrate_status_indexes(self, cursor: sqlite3.Cursor):
+        # Delta queries of /status ("checked or changed since"); "checked since" already
+        # has idx_products_last_checked (last_checked DESC) from _migrate_history_indexes
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_last_changed
+            ON products (last_changed_at)
+        ''')
+
+    def _migrate_product_leases(self, cursor: sqlite3.Cursor):
+        # Products claimed by a worker process until expires_at (UTC)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_leases (
+                product_id INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at TIMESTAMP NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_product_leases_expires
+            ON product_leases (expires_at)
+        ''')
+
+    def _migrate_add_jobs(self, cursor: sqlite3.Cursor):
+        # status: pending -> running (claimed until lease_until, UTC) -> done or failed
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS add_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until TIMESTAMP,
+                product_id INTEGER,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_add_jobs_status
+            ON add_jobs (status, url)
+        ''')
+
+    def _migrate_scheduler_control(self, cursor: sqlite3.Cursor):
+        # Commands for the scheduler process: pending -> done or failed
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_commands (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                command TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                handled_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_scheduler_commands_status
+            ON scheduler_commands (status)
+        ''')
+        # Single row with the latest status the scheduler published
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_status (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                pid INTEGER,
+                payload TEXT NOT NULL,
+                metrics TEXT,
+                updated_at TIMESTAMP NOT NULL
+            )
+        ''')
+
+    def _migrate_product_keys(self, cursor: sqlite3.Cursor):
+        # One row per physical product: `dkp-<id>` (see product_key) is unique, urls are stored without query strings
+        cursor.execute('ALTER TABLE products ADD COLUMN product_key TEXT')
+        cursor.execute('ALTER TABLE add_jobs ADD COLUMN product_key TEXT')
+
+        groups = {}
+        for product_id, url in cursor.execute('SELECT id, url FROM products ORDER BY id').fetchall():
+            groups.setdefault(product_key(url), []).append((product_id, url))
+
+        merged = 0
+        for key, rows in groups.items():
+            keep, url = rows[0]
+            duplicates = [product_id for product_id, _ in rows[1:]]
+            if duplicates:
+                self._merge_products(cursor, keep, duplicates)
+                merged += len(duplicates)
+            cursor.execute('UPDATE products SET product_key = ?, url = ? WHERE id = ?',
+                           (key, clean_url(url), keep))
+
+        cursor.executemany('UPDATE add_jobs SET product_key = ? WHERE id = ?', [
+            (product_key(url), job_id)
+            for job_id, url in cursor.execute('SELECT id, url FROM add_jobs').fetchall()
+        ])
+
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_products_product_key
+            ON products (product_key)
+        ''')
+        cursor.execute('DROP INDEX IF EXISTS idx_add_jobs_status')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_add_jobs_status
+            ON add_jobs (status, product_key)
+        ''')
+        if merged:
+            self._bump_data_version(cursor)
+            print(f"🗄️ Merged {merged} duplicate products")
+
+    def _migrate_remove_orphans(self, cursor: sqlite3.Cursor):
+        # remove_product used to leave a removed product's rows behind
+        self._delete_product_rows(cursor, 'product_id NOT IN (SELECT id FROM products)')
+
+    def _migrate_utc_timestamps(self, cursor: sqlite3.Cursor):
+        # last_checked and last_changed_at used to be written in local time
+        cursor.execute('''
+            UPDATE products
+            SET last_checked = datetime(last_checked, 'utc'),
+                last_changed_at = datetime(last_changed_at, 'utc')
+        ''')
+
+    def _delete_product_rows(self, cursor: sqlite3.Cursor, condition: str, params: Tuple = ()):
+        """Delete the history, rollups, leases and /add jobs whose product_id matches `condition`"""
+        tables = ['price_history'] + [table for table, _ in self.ROLLUPS] + ['product_leases', 'add_jobs']
+        for table in tables:
+            cursor.execute(f'DELETE FROM {table} WHERE {condition}', params)
+
+    def _merge_products(self, cursor: sqlite3.Cursor, keep: int, duplicates: List[int]):
+        """
+        Fold duplicate rows of the same product into `keep`
+
+        History, rollups and /add jobs move to `keep`; the current price
+        comes from the most recently checked row and the schedule from the
+        one due first. Leases of the duplicates are dropped.
+        """
+        ids = [keep] + duplicates
+        placeholders = ','.join('?' * len(ids))
+        duplicate_placeholders = ','.join('?' * len(duplicates))
+        rows = cursor.execute(f'''
+            SELECT id, name, current_price, lowest_price, last_checked, last_changed_at,
+                   next_check_at, check_interval, interval_override, created_at
+            FROM products WHERE id IN ({placeholders})
+        ''', ids).fetchall()
+        newest = max(rows, key=lambda row: (row[4] or '', row[0] == keep))
+
+        def earliest(values):
+            # NULL next_check_at means "due now", so it wins
+            return None if None in values else min(values)
+
+        def smallest(index):
+            values = [row[index] for row in rows if row[index] is not None]
+            return min(values) if values else None
+
+        cursor.execute('''
+            UPDATE products
+            SET name = ?, current_price = ?, lowest_price = ?, last_checked = ?,
+                last_changed_at = ?, next_check_at = ?, check_interval = ?,
+                interval_override = ?, created_at = ?
+            WHERE id = ?
+        ''', (
+            newest[1], newest[2], min(row[3] for row in rows), newest[4],
+            max((row[5] for row in rows if row[5]), default=None),
+            earliest([row[6] for row in rows]),
+            smallest(7), smallest(8), smallest(9),
+            keep
+        ))
+
+        cursor.execute(f'UPDATE price_history SET product_id = ? WHERE product_id IN ({duplicate_placeholders})',
+                       [keep] + duplicates)
+        if self.history_mode == "compact":
+            # The interleaved runs of both rows become single runs again
+            self._compact_product_history(cursor, keep)
+
+        for table, _ in self.ROLLUPS:
+            # Buckets both rows saw are combined; open/close keep the surviving row's values
+            cursor.execute(f'''
+                INSERT INTO {table} (product_id, bucket_start, open_price, close_price,
+                                     min_price, max_price, observation_count)
+                SELECT ?, bucket_start, open_price, close_price, min_price, max_price, observation_count
+                FROM {table} WHERE product_id IN ({duplicate_placeholders})
+                ON CONFLICT (product_id, bucket_start) DO UPDATE SET
+                    min_price = MIN(min_price, excluded.min_price),
+                    max_price = MAX(max_price, excluded.max_price),
+                    observation_count = observation_count + excluded.observation_count
+            ''', [keep] + duplicates)
+            cursor.execute(f'DELETE FROM {table} WHERE product_id IN ({duplicate_placeholders})',
+                           duplicates)
+
+        cursor.execute(f'UPDATE add_jobs SET product_id = ? WHERE product_id IN ({duplicate_placeholders})',
+                       [keep] + duplicates)
+        cursor.execute(f'DELETE FROM product_leases WHERE product_id IN ({duplicate_placeholders})',
+                       duplicates)
+        cursor.execute(f'DELETE FROM products WHERE id IN ({duplicate_placeholders})', duplicates)
+
+    def _bump_data_version(self, cursor: sqlite3.Cursor):
+        # Lets readers (e.g. the dashboard cache) tell that product data changed
+        cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+    def get_data_version(self) -> int:
+        """Counter that grows whenever products are added, updated or removed"""
+        row = self._connection().execute(
+            "SELECT value FROM meta WHERE key = 'data_version'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_meta_value(self, key: str, default: int = 0) -> int:
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta_value(self, key: str, value: int):
+        with self._transaction() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def enqueue_scheduler_command(self, command: str) -> int:
+        """Queue a command for the scheduler (see price_monitor.control), returns its id"""
+        with self._transaction() as cursor:
+            cursor.execute('INSERT INTO scheduler_commands (command) VALUES (?)', (command,))
+            return cursor.lastrowid
+
+    def get_pending_scheduler_commands(self, limit: int = 20) -> List[Dict]:
+        cursor = self._connection().execute('''
+            SELECT id, command FROM scheduler_commands
+            WHERE status = 'pending'
+            ORDER BY id
+            LIMIT ?
+        ''', (limit,))
+        return [{'id': row[0], 'command': row[1]} for row in cursor.fetchall()]
+
+    def finish_scheduler_command(self, command_id: int, status: str, result: Optional[str] = None):
+        """Mark a command 'done' or 'failed' with a short result message"""
+        with self._transaction() as cursor:
             cursor.execute('''
-                INSERT INTO products (url, name, current_price, lowest_price, last_checked)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (url, name, price, price, now))
-            
-            product_id = cursor.lastrowid
-            
-            # Add to history
+                UPDATE scheduler_commands SET status = ?, result = ?, handled_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, result, command_id))
+
+    def get_scheduler_command(self, command_id: int) -> Optional[Dict]:
+        row = self._connection().execute('''
+            SELECT id, command, status, result, created_at, handled_at
+            FROM scheduler_commands WHERE id = ?
+        ''', (command_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'command', 'status', 'result', 'created_at', 'handled_at'), row))
+
+    def save_scheduler_status(self, pid: int, payload: Dict, metrics: Optional[str] = None):
+        """Publish the scheduler's status (and Prometheus metrics text) for other processes"""
+        with self._transaction() as cursor:
             cursor.execute('''
-                INSERT INTO price_history (product_id, price)
-                VALUES (?, ?)
-            ''', (product_id, price))
-            
-            conn.commit()
-            conn.close()
-            
+                INSERT OR REPLACE INTO scheduler_status (id, pid, payload, metrics, updated_at)
+                VALUES (1, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (pid, json.dumps(payload, ensure_ascii=False, default=str), metrics))
+
+    def get_scheduler_status(self) -> Optional[Dict]:
+        """
+        Latest status published by the scheduler
+
+        Returns:
+            Dict with 'pid', 'status', 'metrics', 'updated_at' (UTC) and
+            'age_seconds', None if no scheduler has published yet
+        """
+        row = self._connection().execute('''
+            SELECT pid, payload, metrics, updated_at,
+                   (julianday('now') - julianday(updated_at)) * 86400
+            FROM scheduler_status WHERE id = 1
+        ''').fetchone()
+        if row is None:
+            return None
+        return {
+            'pid': row[0],
+            'status': json.loads(row[1]),
+            'metrics': row[2],
+            'updated_at': row[3],
+            'age_seconds': round(row[4], 3)
+        }
+
+    def make_all_products_due(self) -> int:
+        """Schedule every product for an immediate check, returns the number of products"""
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE products SET next_check_at = NULL')
+            return cursor.rowcount
+
+    def add_product(self, url: str, name: str, price: int) -> bool:
+        """Add a new product to monitor (False if the same product is already monitored under any url)"""
+        try:
+            with self._transaction() as cursor:
+                now = utc_now()
+
+                cursor.execute('''
+                    INSERT INTO products (url, product_key, name, current_price, lowest_price, last_checked)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (clean_url(url), product_key(url), name, price, price, now))
+
+                product_id = cursor.lastrowid
+
+                # Add to history
+                self._record_history(cursor, [(product_id, price, None)])
+                self._bump_data_version(cursor)
+
             print(f"✅ Added product: {name}")
             return True
-            
+
         except sqlite3.IntegrityError:
             print(f"⚠️ Product already exists: {url}")
             return False
         except Exception as e:
             print(f"❌ Error adding product: {e}")
             return False
-    
+
+    def add_products_bulk(self, products: List[Tuple[str, str, int]],
+                          next_check_in: Optional[float] = None) -> Dict[str, int]:
+        """
+        Add many products in a single transaction
+
+        Args:
+            products: (url, name, price) tuples; products already monitored
+                (by product_key, under any url) are skipped
+            next_check_in: Seconds until the first scheduled check of the new
+                products (default: due right away, like add_product)
+
+        Returns:
+            Dict with the number of products 'added' and already 'existing'
+        """
+        with self._transaction() as cursor:
+            added = sum(1 for product_id in self._insert_products(cursor, products, next_check_in)
+                        if product_id is not None)
+
+        print(f"✅ Added {added} products ({len(products) - added} already monitored)")
+        return {'added': added, 'existing': len(products) - added}
+
+    def _insert_products(self, cursor: sqlite3.Cursor, products: List[Tuple[str, str, int]],
+                         next_check_in: Optional[float] = None) -> List[Optional[int]]:
+        """Insert (url, name, price) products with their first history row, returns the new ids (None if the url existed)"""
+        modifier = f"+{int(next_check_in)} seconds" if next_check_in else None
+        now = utc_now()
+        ids = []
+        observations = []
+        for url, name, price in products:
+            cursor.execute('''
+                INSERT OR IGNORE INTO products
+                    (url, product_key, name, current_price, lowest_price, last_checked, next_check_at)
+                VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))
+            ''', (clean_url(url), product_key(url), name, price, price, now, modifier))
+            product_id = cursor.lastrowid if cursor.rowcount else None
+            ids.append(product_id)
+            if product_id is not None:
+                observations.append((product_id, price, None))
+
+        if observations:
+            self._record_history(cursor, observations)
+            self._bump_data_version(cursor)
+        return ids
+
+    def enqueue_add_job(self, url: str) -> Optional[Dict]:
+        """
+        Queue the first scrape of a new product (see claim_add_jobs)
+
+        Returns:
+            The job dict (an unfinished job for the same product is reused),
+            None if the product is already monitored
+        """
+        key = product_key(url)
+        with self._transaction() as cursor:
+            if cursor.execute('SELECT 1 FROM products WHERE product_key = ?', (key,)).fetchone():
+                return None
+            row = cursor.execute('''
+                SELECT id FROM add_jobs WHERE status IN ('pending', 'running') AND product_key = ?
+            ''', (key,)).fetchone()
+            if row:
+                job_id = row[0]
+            else:
+                cursor.execute('INSERT INTO add_jobs (url, product_key) VALUES (?, ?)',
+                               (clean_url(url), key))
+                job_id = cursor.lastrowid
+        return self.get_add_job(job_id)
+
+    def claim_add_jobs(self, limit: int, lease_seconds: int = 600) -> List[Dict]:
+        """
+        Mark up to `limit` pending jobs as running
+
+        Jobs whose lease ran out (the process died mid-scrape) are claimed again.
+
+        Returns:
+            List of {'id', 'url', 'attempts'} dicts
+        """
+        with self._transaction() as cursor:
+            cursor.execute('''
+                SELECT id, url, attempts FROM add_jobs
+                WHERE status = 'pending'
+                   OR (status = 'running' AND lease_until <= CURRENT_TIMESTAMP)
+                ORDER BY id
+                LIMIT ?
+            ''', (limit,))
+            jobs = [{'id': row[0], 'url': row[1], 'attempts': row[2] + 1} for row in cursor.fetchall()]
+            cursor.executemany('''
+                UPDATE add_jobs
+                SET status = 'running', attempts = attempts + 1, lease_until = datetime('now', ?)
+                WHERE id = ?
+            ''', [(f'+{int(lease_seconds)} seconds', job['id']) for job in jobs])
+        return jobs
+
+    def finish_add_jobs(self, results: List[Tuple[int, str, Optional[Dict], Optional[str]]],
+                        next_check_in: Optional[float] = None) -> int:
+        """
+        Store the outcome of claimed jobs in one transaction
+
+        Args:
+            results: (job_id, url, product info or None, error) tuples; the
+                products of successful jobs are added
+            next_check_in: Seconds until the first scheduled check of the new products
+
+        Returns:
+            Number of products added
+        """
+        succeeded = [(job_id, url, info) for job_id, url, info, _ in results if info]
+        with self._transaction() as cursor:
+            ids = self._insert_products(
+                cursor, [(url, info['name'], info['price']) for _, url, info in succeeded], next_check_in
+            )
+            cursor.executemany('''
+                UPDATE add_jobs
+                SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP,
+                    product_id = COALESCE(?, (SELECT id FROM products WHERE product_key = ?))
+                WHERE id = ?
+            ''', [(product_id, product_key(url), job_id)
+                  for (job_id, url, _), product_id in zip(succeeded, ids)])
+            cursor.executemany('''
+                UPDATE add_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(error or 'scrape failed', job_id) for job_id, _, info, error in results if not info])
+        return sum(1 for product_id in ids if product_id is not None)
+
+    def get_add_job(self, job_id: int) -> Optional[Dict]:
+        """Status of an /add job, with the product's name and price once it is done"""
+        row = self._connection().execute('''
+            SELECT j.id, j.url, j.status, j.attempts, j.error, j.created_at, j.finished_at,
+                   j.product_id, p.name, p.current_price
+            FROM add_jobs j LEFT JOIN products p ON p.id = j.product_id
+            WHERE j.id = ?
+        ''', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'url': row[1],
+            'status': row[2],
+            'attempts': row[3],
+            'error': row[4],
+            'created_at': row[5],
+            'finished_at': row[6],
+            'product_id': row[7],
+            'name': row[8],
+            'price': row[9]
+        }
+
+    def get_product_urls(self) -> List[str]:
+        """URLs of all monitored products"""
+        return [row[0] for row in self._connection().execute('SELECT url FROM products')]
+
     def update_price(self, url: str, new_price: int) -> Optional[Dict]:
         """
         Update product price and return info if price dropped
-        
+
         Returns:
             Dict with product info if price dropped, None otherwise
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get current product info
-        cursor.execute('''
-            SELECT id, name, current_price, lowest_price
-            FROM products WHERE url = ?
-        ''', (url,))
-        
-        result = cursor.fetchone()
-        if not result:
-            conn.close()
-            return None
-        
-        product_id, name, old_price, lowest_price = result
-        now = datetime.now()
-        
-        # Update product
-        new_lowest = min(new_price, lowest_price)
-        cursor.execute('''
-            UPDATE products
-            SET current_price = ?, lowest_price = ?, last_checked = ?
-            WHERE id = ?
-        ''', (new_price, new_lowest, now, product_id))
-        
-        # Add to history
-        cursor.execute('''
-            INSERT INTO price_history (product_id, price)
+        drops = self.update_prices_bulk([(url, new_price)])
+        return drops[0] if drops else None
+
+    def update_prices_bulk(self, results: List[Tuple[str, int]],
+                           enqueue_notifications: bool = False) -> List[Dict]:
+        """
+        Apply a batch of scrape results in a single transaction
+
+        Args:
+            results: (url, new_price) or (url, new_price, next_check_in) tuples,
+                matched by product_key (any url of a product works), the last
+                one wins for a repeated product; next_check_in (seconds)
+                also becomes the product's check interval
+            enqueue_notifications: Also write the price drops to the notification
+                outbox, atomically with the price update
+
+        Returns:
+            List of price drop dicts (same shape as update_price returns)
+        """
+        latest = {product_key(result[0]): result for result in results}
+        if not latest:
+            return []
+
+        drops = []
+        with STAGE_SECONDS.labels(stage='db_update').time(), self._transaction() as cursor:
+            # Get current product info
+            rows = {}
+            keys = list(latest)
+            for start in range(0, len(keys), self.MAX_SQL_VARIABLES):
+                chunk = keys[start:start + self.MAX_SQL_VARIABLES]
+                cursor.execute(f'''
+                    SELECT id, product_key, url, name, current_price, lowest_price
+                    FROM products WHERE product_key IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                for row in cursor.fetchall():
+                    rows[row[1]] = row
+
+            now = utc_now()
+            updates = []
+            observations = []
+            for key, result in latest.items():
+                if key not in rows:
+                    continue
+                new_price = result[1]
+                next_check_in = result[2] if len(result) > 2 else None
+                product_id, _, url, name, old_price, lowest_price = rows[key]
+                updates.append((
+                    new_price, min(new_price, lowest_price), now,
+                    now if new_price != old_price else None,
+                    next_check_in,
+                    f'+{int(next_check_in)} seconds' if next_check_in is not None else None,
+                    product_id
+                ))
+                observations.append((product_id, new_price, old_price))
+
+                # Check if price dropped
+                if new_price < old_price:
+                    drop = self._price_drop_info(name, url, old_price, new_price)
+                    drop['idempotency_key'] = (
+                        f"drop:{product_id}:{old_price}:{new_price}:{now:%Y%m%d%H%M}"
+                    )
+                    drops.append(drop)
+
+            cursor.executemany('''
+                UPDATE products
+                SET current_price = ?, lowest_price = ?, last_checked = ?,
+                    last_changed_at = COALESCE(?, last_changed_at),
+                    check_interval = COALESCE(?, check_interval),
+                    next_check_at = COALESCE(datetime('now', ?), next_check_at)
+                WHERE id = ?
+            ''', updates)
+
+            self._record_history(cursor, observations)
+            if updates:
+                self._bump_data_version(cursor)
+
+            if enqueue_notifications:
+                self._enqueue_notifications(cursor, drops)
+
+        return drops
+
+    def reschedule_products(self, schedule: List[Tuple[str, float]]):
+        """Set the next check of products to `seconds` from now, given (url, seconds) pairs"""
+        with self._transaction() as cursor:
+            cursor.executemany('''
+                UPDATE products SET next_check_at = datetime('now', ?) WHERE product_key = ?
+            ''', [(f'+{int(seconds)} seconds', product_key(url)) for url, seconds in schedule])
+
+    def set_check_interval_override(self, url: str, seconds: Optional[int]) -> bool:
+        """
+        Pin a product's check interval (None returns it to adaptive scheduling)
+
+        The product also becomes due immediately so the new interval applies.
+
+        Returns:
+            True if the product exists
+        """
+        with self._transaction() as cursor:
+            cursor.execute('''
+                UPDATE products SET interval_override = ?, next_check_at = CURRENT_TIMESTAMP
+                WHERE product_key = ?
+            ''', (seconds, product_key(url)))
+            return cursor.rowcount > 0
+
+    def enqueue_notifications(self, drops: List[Dict]) -> int:
+        """
+        Add price drops to the notification outbox
+
+        Drops need an `idempotency_key`; a key that is already in the outbox
+        is ignored, so enqueueing the same event twice sends one email.
+
+        Returns:
+            Number of new outbox entries
+        """
+        with self._transaction() as cursor:
+            return self._enqueue_notifications(cursor, drops)
+
+    def _enqueue_notifications(self, cursor: sqlite3.Cursor, drops: List[Dict]) -> int:
+        before = self._connection().total_changes
+        cursor.executemany('''
+            INSERT OR IGNORE INTO notification_outbox (idempotency_key, payload)
             VALUES (?, ?)
-        ''', (product_id, new_price))
-        
-        conn.commit()
-        conn.close()
-        
-        # Check if price dropped
-        if new_price < old_price:
-            price_drop = old_price - new_price
-            drop_percentage = (price_drop / old_price) * 100
-            
-            return {
-                'name': name,
-                'url': url,
-                'old_price': old_price,
-                'new_price': new_price,
-                'price_drop': price_drop,
-                'drop_percentage': drop_percentage
-            }
-        
-        return None
-    
+        ''', [(drop['idempotency_key'], json.dumps(drop, ensure_ascii=False)) for drop in drops])
+        return self._connection().total_changes - before
+
+    def claim_due_notifications(self, limit: Optional[int] = 20, lease_seconds: int = 300) -> List[Dict]:
+        """
+        Claim outbox entries that are due for a delivery attempt
+
+        Claimed entries are leased for `lease_seconds`; if the sender dies
+        before reporting back, they become due again when the lease expires.
+        A `limit` of None claims every due entry.
+
+        Returns:
+            List of dicts with id, idempotency_key, attempts and payload
+        """
+        with self._transaction() as cursor:
+            cursor.execute('''
+                SELECT id, idempotency_key, attempts, payload
+                FROM notification_outbox
+                WHERE status IN ('pending', 'sending') AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            ''', (-1 if limit is None else limit,))
+            rows = cursor.fetchall()
+
+            cursor.executemany('''
+                UPDATE notification_outbox
+                SET status = 'sending', attempts = attempts + 1,
+                    next_attempt_at = datetime('now', ?)
+                WHERE id = ?
+            ''', [(f'+{int(lease_seconds)} seconds', row[0]) for row in rows])
+
+        return [{
+            'id': row[0],
+            'idempotency_key': row[1],
+            'attempts': row[2] + 1,
+            'payload': json.loads(row[3])
+        } for row in rows]
+
+    def mark_notifications_sent(self, ids: List[int]):
+        """Record successful delivery of outbox entries"""
+        with self._transaction() as cursor:
+            cursor.executemany('''
+                UPDATE notification_outbox
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                WHERE id = ?
+            ''', [(notification_id,) for notification_id in ids])
+
+    def mark_notifications_failed(self, ids: List[int], error: str,
+                                  retry_in: Optional[float]):
+        """
+        Record a failed delivery attempt
+
+        Args:
+            retry_in: Seconds until the next attempt, None gives up (status "dead")
+        """
+        with self._transaction() as cursor:
+            if retry_in is None:
+                cursor.executemany('''
+                    UPDATE notification_outbox SET status = 'dead', last_error = ?
+                    WHERE id = ?
+                ''', [(error, notification_id) for notification_id in ids])
+            else:
+                cursor.executemany('''
+                    UPDATE notification_outbox
+                    SET status = 'pending', last_error = ?, next_attempt_at = datetime('now', ?)
+                    WHERE id = ?
+                ''', [(error, f'+{int(retry_in)} seconds', notification_id) for notification_id in ids])
+
+    def get_outbox_stats(self) -> Dict:
+        """Number of outbox entries per status"""
+        cursor = self._connection().execute(
+            'SELECT status, COUNT(*) FROM notification_outbox GROUP BY status'
+        )
+        return {status: count for status, count in cursor.fetchall()}
+
+    def _record_history(self, cursor: sqlite3.Cursor, observations: List[Tuple]):
+        """
+        Write price observations to price_history
+
+        Args:
+            observations: (product_id, new_price, previous_price) tuples; the
+                previous price is None for a newly added product
+        """
+        if self.history_mode == "compact":
+            repeats = [(pid,) for pid, price, previous in observations if price == previous]
+            changes = [(pid, price) for pid, price, previous in observations if price != previous]
+        else:
+            repeats = []
+            changes = [(pid, price) for pid, price, _ in observations]
+
+        if repeats:
+            cursor.executemany('''
+                UPDATE price_history
+                SET last_seen_at = CURRENT_TIMESTAMP, observation_count = observation_count + 1
+                WHERE id = (
+                    SELECT id FROM price_history WHERE product_id = ?
+                    ORDER BY checked_at DESC, id DESC LIMIT 1
+                )
+            ''', repeats)
+            if cursor.rowcount < len(repeats):
+                # Some products have no history row left to extend
+                cursor.executemany('''
+                    INSERT INTO price_history (product_id, price, checked_at, last_seen_at)
+                    SELECT ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                    WHERE NOT EXISTS (SELECT 1 FROM price_history WHERE product_id = ?)
+                ''', [(pid, price, pid) for pid, price, previous in observations
+                      if price == previous])
+
+        cursor.executemany('''
+            INSERT INTO price_history (product_id, price, checked_at, last_seen_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ''', changes)
+
+        # Every observation also lands in the current hourly and daily buckets
+        rollup_rows = [(pid, price, price, price, price) for pid, price, _ in observations]
+        for table, bucket_format in self.ROLLUPS:
+            cursor.executemany(f'''
+                INSERT INTO {table} (product_id, bucket_start, open_price, close_price,
+                                     min_price, max_price, observation_count)
+                VALUES (?, strftime('{bucket_format}', 'now'), ?, ?, ?, ?, 1)
+                ON CONFLICT (product_id, bucket_start) DO UPDATE SET
+                    close_price = excluded.close_price,
+                    min_price = MIN(min_price, excluded.min_price),
+                    max_price = MAX(max_price, excluded.max_price),
+                    observation_count = observation_count + 1
+            ''', rollup_rows)
+
+    def compact_history(self) -> Dict:
+        """
+        Merge consecutive identical prices of every product into runs
+
+        One-time conversion of a database written in "full" history mode.
+        Each product is compacted in its own transaction.
+
+        Returns:
+            Dict with the number of products processed and rows removed
+        """
+        product_ids = [row[0] for row in self._connection().execute(
+            'SELECT DISTINCT product_id FROM price_history'
+        )]
+
+        removed = 0
+        for product_id in product_ids:
+            with self._transaction() as cursor:
+                removed += self._compact_product_history(cursor, product_id)
+
+        return {'products': len(product_ids), 'rows_removed': removed}
+
+    def vacuum(self):
+        """
+        Rebuild the database file so space freed by deleted rows goes back to the disk
+
+        Holds an exclusive lock until it finishes; run it when nothing else is writing.
+        """
+        self._connection().execute('VACUUM')
+
+    def _compact_product_history(self, cursor: sqlite3.Cursor, product_id: int) -> int:
+        """Merge consecutive identical prices of one product, returns the number of rows removed"""
+        cursor.execute('''
+            SELECT id, price, checked_at, COALESCE(last_seen_at, checked_at), observation_count
+            FROM price_history WHERE product_id = ?
+            ORDER BY checked_at, id
+        ''', (product_id,))
+
+        runs = []
+        duplicates = []
+        for row_id, price, checked_at, last_seen_at, count in cursor.fetchall():
+            if runs and runs[-1][1] == price:
+                runs[-1][2] = max(runs[-1][2], last_seen_at)
+                runs[-1][3] += count
+                duplicates.append((row_id,))
+            else:
+                runs.append([row_id, price, last_seen_at, count])
+
+        if duplicates:
+            cursor.executemany('''
+                UPDATE price_history SET last_seen_at = ?, observation_count = ?
+                WHERE id = ?
+            ''', [(last_seen_at, count, row_id) for row_id, _, last_seen_at, count in runs])
+            cursor.executemany('DELETE FROM price_history WHERE id = ?', duplicates)
+        return len(duplicates)
+
+    @staticmethod
+    def _price_drop_info(name: str, url: str, old_price: int, new_price: int) -> Dict:
+        price_drop = old_price - new_price
+        drop_percentage = (price_drop / old_price) * 100
+
+        return {
+            'name': name,
+            'url': url,
+            'old_price': old_price,
+            'new_price': new_price,
+            'price_drop': price_drop,
+            'drop_percentage': drop_percentage
+        }
+
+    @staticmethod
+    def _product_dict(row: Tuple) -> Dict:
+        """Product dict from a row selected with PRODUCT_COLUMNS"""
+        return {
+            'id': row[0],
+            'url': row[1],
+            'name': row[2],
+            'current_price': row[3],
+            'lowest_price': row[4],
+            'last_checked': row[5] if row[5] else 'هرگز',
+            'next_check_at': row[6],
+            'check_interval': row[7],
+            'interval_override': row[8]
+        }
+
     def get_all_products(self) -> List[Dict]:
         """Get all monitored products"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT url, name, current_price, lowest_price, last_checked
+        cursor = self._connection().execute(f'''
+            SELECT {self.PRODUCT_COLUMNS}
             FROM products
             ORDER BY last_checked DESC
         ''')
-        
+        return [self._product_dict(row) for row in cursor.fetchall()]
+
+    def get_due_products(self, limit: int) -> List[Dict]:
+        """Products whose next check is due, most overdue first (leases are ignored)"""
+        cursor = self._connection().execute(f'''
+            SELECT {self.PRODUCT_COLUMNS}
+            FROM products
+            WHERE next_check_at IS NULL OR next_check_at <= CURRENT_TIMESTAMP
+            ORDER BY next_check_at
+            LIMIT ?
+        ''', (limit,))
+        return [self._product_dict(row) for row in cursor.fetchall()]
+
+    def claim_due_products(self, owner: str, limit: int, lease_seconds: int = 300) -> List[Dict]:
+        """
+        Lease up to `limit` due products to a worker
+
+        Products leased to another worker are skipped until the lease is
+        released or expires, so a crashed worker's products come back
+        after `lease_seconds`.
+
+        Args:
+            owner: Worker id the leases are recorded under
+            limit: Maximum number of products claimed
+            lease_seconds: Lease duration
+
+        Returns:
+            List of product dicts (same shape as get_all_products returns)
+        """
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM product_leases WHERE expires_at <= CURRENT_TIMESTAMP')
+            cursor.execute(f'''
+                SELECT {self.PRODUCT_COLUMNS}
+                FROM products
+                WHERE (next_check_at IS NULL OR next_check_at <= CURRENT_TIMESTAMP)
+                  AND id NOT IN (SELECT product_id FROM product_leases)
+                ORDER BY next_check_at
+                LIMIT ?
+            ''', (limit,))
+            products = [self._product_dict(row) for row in cursor.fetchall()]
+            cursor.executemany('''
+                INSERT INTO product_leases (product_id, owner, expires_at)
+                VALUES (?, ?, datetime('now', ?))
+            ''', [(product['id'], owner, f'+{int(lease_seconds)} seconds') for product in products])
+        return products
+
+    def release_products(self, owner: str, product_ids: List[int]):
+        """Drop the leases `owner` holds on the given products"""
+        with self._transaction() as cursor:
+            for start in range(0, len(product_ids), self.MAX_SQL_VARIABLES - 1):
+                chunk = product_ids[start:start + self.MAX_SQL_VARIABLES - 1]
+                cursor.execute(f'''
+                    DELETE FROM product_leases
+                    WHERE owner = ? AND product_id IN ({','.join('?' * len(chunk))})
+                ''', [owner] + chunk)
+
+    def get_products_page(self, limit: int = 100, after_id: int = 0,
+                          since: Optional[datetime] = None, changed_only: bool = False,
+                          fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get one page of products in id order (keyset pagination)
+
+        Args:
+            limit: Maximum number of products returned
+            after_id: Only products with a larger id (the previous page's last id)
+            since: Only products checked after this time
+            changed_only: With `since`, only products whose price changed after it
+            fields: Columns to return (see PRODUCT_FIELDS), all when None;
+                `id` is always included
+
+        Returns:
+            List of product dicts
+        """
+        fields = list(fields or self.PRODUCT_FIELDS)
+        unknown = set(fields) - set(self.PRODUCT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown product fields: {', '.join(sorted(unknown))}")
+
+        # id is always read so the caller can build the next cursor
+        columns = fields if 'id' in fields else ['id'] + fields
+        where = ['id > ?']
+        params = [after_id]
+        source = 'products'
+        if since is not None:
+            column, index = (('last_changed_at', 'idx_products_last_changed') if changed_only
+                             else ('last_checked', 'idx_products_last_checked'))
+            where.append(f'{column} > ?')
+            params.append(since)
+            # A delta is usually small, so walk the timestamp index rather than every id
+            source = f'products INDEXED BY {index}'
+        params.append(limit)
+
+        cursor = self._connection().execute(f'''
+            SELECT {', '.join(columns)}
+            FROM {source}
+            WHERE {' AND '.join(where)}
+            ORDER BY id
+            LIMIT ?
+        ''', params)
+
         products = []
         for row in cursor.fetchall():
-            products.append({
-                'url': row[0],
-                'name': row[1],
-                'current_price': row[2],
-                'lowest_price': row[3],
-                'last_checked': row[4] if row[4] else 'هرگز'
-            })
-        
-        conn.close()
+            product = dict(zip(columns, row))
+            if 'last_checked' in product and not product['last_checked']:
+                product['last_checked'] = 'هرگز'
+            products.append(product)
         return products
-    
+
+    def count_products(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
     def get_price_history(self, url: str, limit: int = 10) -> List[Dict]:
-        """Get price history for a product"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ph.price, ph.checked_at
-            FROM price_history ph
-            JOIN products p ON ph.product_id = p.id
-            WHERE p.url = ?
-            ORDER BY ph.checked_at DESC
+        """
+        Get the last `limit` price observations of a product, newest first
+
+        Returns the same entries in both history modes: in "compact" mode a
+        run of identical observations is expanded back into one entry per
+        check, with the checks in between spread evenly from the run's
+        first to last sighting (their exact times are not stored).
+        """
+        # Every run holds at least one observation, so `limit` runs are always enough
+        cursor = self._connection().execute('''
+            SELECT price, checked_at, COALESCE(last_seen_at, checked_at), observation_count
+            FROM price_history
+            WHERE product_id = (SELECT id FROM products WHERE product_key = ?)
+            ORDER BY checked_at DESC, id DESC
             LIMIT ?
-        ''', (url, limit))
-        
+        ''', (product_key(url), limit))
+
         history = []
+        for price, checked_at, last_seen_at, count in cursor.fetchall():
+            for seen_at in self._observation_times(checked_at, last_seen_at, count):
+                if len(history) >= limit:
+                    return history
+                history.append({
+                    'price': price,
+                    'checked_at': seen_at,
+                    'last_seen_at': seen_at,
+                    'observation_count': 1
+                })
+
+        return history
+
+    @staticmethod
+    def _observation_times(first_seen: str, last_seen: str, count: int) -> List[str]:
+        """Times of the `count` observations of a run, newest first"""
+        if count <= 1 or first_seen == last_seen:
+            return [last_seen] * max(count, 1)
+        start = datetime.fromisoformat(first_seen)
+        step = (datetime.fromisoformat(last_seen) - start) / (count - 1)
+        return [(start + step * i).strftime('%Y-%m-%d %H:%M:%S') for i in range(count - 1, -1, -1)]
+
+    def get_price_history_range(self, url: str, start: datetime, end: datetime,
+                                raw_max_days: float = 2,
+                                hourly_max_days: float = 90) -> Dict:
+        """
+        Get price history between two UTC timestamps at a suitable resolution
+
+        Short ranges read raw history; longer ranges (or ranges reaching past
+        the raw retention window) read the hourly or daily rollups.
+
+        Returns:
+            Dict with `resolution` ("raw", "hourly" or "daily") and `points`,
+            oldest first, each with time, open, close, min, max and count
+        """
+        now = utc_now()
+        span_days = (end - start).total_seconds() / 86400
+
+        def retained(days: Optional[int]) -> bool:
+            return days is None or start >= now - timedelta(days=days)
+
+        if span_days <= raw_max_days and retained(self.raw_retention_days):
+            resolution = 'raw'
+        elif span_days <= hourly_max_days and retained(self.hourly_retention_days):
+            resolution = 'hourly'
+        else:
+            resolution = 'daily'
+
+        start_text = start.strftime('%Y-%m-%d %H:%M:%S')
+        end_text = end.strftime('%Y-%m-%d %H:%M:%S')
+        conn = self._connection()
+
+        if resolution == 'raw':
+            # Runs that overlap the range, not only those that started inside it
+            cursor = conn.execute('''
+                SELECT checked_at, price, price, price, price, observation_count
+                FROM price_history
+                WHERE product_id = (SELECT id FROM products WHERE product_key = ?)
+                  AND checked_at <= ? AND COALESCE(last_seen_at, checked_at) >= ?
+                ORDER BY checked_at, id
+            ''', (product_key(url), end_text, start_text))
+        else:
+            table = 'price_rollup_hourly' if resolution == 'hourly' else 'price_rollup_daily'
+            bucket_format = dict(self.ROLLUPS)[table]
+            cursor = conn.execute(f'''
+                SELECT bucket_start, open_price, close_price, min_price, max_price, observation_count
+                FROM {table}
+                WHERE product_id = (SELECT id FROM products WHERE product_key = ?)
+                  AND bucket_start BETWEEN strftime('{bucket_format}', ?) AND ?
+                ORDER BY bucket_start
+            ''', (product_key(url), start_text, end_text))
+
+        points = []
         for row in cursor.fetchall():
-            history.append({
-                'price': row[0],
-                'checked_at': row[1]
+            points.append({
+                'time': row[0],
+                'open': row[1],
+                'close': row[2],
+                'min': row[3],
+                'max': row[4],
+                'count': row[5]
             })
-        
-        conn.close()
-        return history
-    
+
+        return {'resolution': resolution, 'points': points}
+
+    def prune_history(self, max_batches: Optional[int] = None) -> Dict:
+        """
+        Apply the retention policy in small batches
+
+        Deletes raw history rows last seen before `raw_retention_days` (the
+        newest row of each product is always kept) and hourly rollups older
+        than `hourly_retention_days`. Each batch is its own transaction so
+        the scheduler's writes are never blocked for long.
+
+        Returns:
+            Dict with the number of raw and hourly rows deleted
+        """
+        deleted = {'raw': 0, 'hourly': 0}
+
+        if self.raw_retention_days is not None:
+            cutoff = f'-{int(self.raw_retention_days)} days'
+            deleted['raw'] = self._delete_in_batches('''
+                DELETE FROM price_history WHERE id IN (
+                    SELECT ph.id FROM price_history ph
+                    WHERE ph.checked_at < datetime('now', ?)
+                      AND COALESCE(ph.last_seen_at, ph.checked_at) < datetime('now', ?)
+                      AND ph.id != (
+                          SELECT id FROM price_history WHERE product_id = ph.product_id
+                          ORDER BY checked_at DESC, id DESC LIMIT 1
+                      )
+                    LIMIT ?
+                )
+            ''', (cutoff, cutoff), max_batches)
+
+        if self.hourly_retention_days is not None:
+            cutoff = f'-{int(self.hourly_retention_days)} days'
+            deleted['hourly'] = self._delete_in_batches('''
+                DELETE FROM price_rollup_hourly WHERE (product_id, bucket_start) IN (
+                    SELECT product_id, bucket_start FROM price_rollup_hourly
+                    WHERE bucket_start < datetime('now', ?)
+                    LIMIT ?
+                )
+            ''', (cutoff,), max_batches)
+
+        with self._transaction() as cursor:
+            cursor.execute('''
+                DELETE FROM add_jobs
+                WHERE status IN ('done', 'failed') AND finished_at < datetime('now', ?)
+            ''', (f'-{self.FINISHED_JOB_RETENTION_DAYS} days',))
+            cursor.execute('''
+                DELETE FROM scheduler_commands
+                WHERE status != 'pending' AND handled_at < datetime('now', ?)
+            ''', (f'-{self.FINISHED_JOB_RETENTION_DAYS} days',))
+
+        return deleted
+
+    def _delete_in_batches(self, sql: str, params: Tuple, max_batches: Optional[int]) -> int:
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            with self._transaction() as cursor:
+                cursor.execute(sql, params + (self.prune_batch_size,))
+                deleted = cursor.rowcount
+            total += deleted
+            batches += 1
+            if deleted < self.prune_batch_size:
+                break
+        return total
+
     def remove_product(self, url: str) -> bool:
-        """Remove a product from monitoring"""
+        """Remove a product from monitoring, together with its history"""
+        key = product_key(url)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM products WHERE url = ?', (url,))
-            
-            conn.commit()
-            deleted = cursor.rowcount > 0
-            conn.close()
-            
+            with self._transaction() as cursor:
+                self._delete_product_rows(
+                    cursor, 'product_id IN (SELECT id FROM products WHERE product_key = ?)', (key,)
+                )
+                cursor.execute('DELETE FROM products WHERE product_key = ?', (key,))
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    self._bump_data_version(cursor)
+
             return deleted
         except Exception as e:
             print(f"❌ Error removing product: {e}")
-            return False
\ No newline at end of file
+            return False
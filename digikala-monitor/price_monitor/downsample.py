@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+
+METHODS = ("minmax", "lttb")
+
+
+def point_timestamp(point: Dict) -> float:
+    """Unix time of a history point (its `time` is a UTC "YYYY-MM-DD HH:MM:SS" string)"""
+    moment = datetime.fromisoformat(point['time'][:19])
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def minmax(points: List[Dict], target: int) -> List[Dict]:
+    """
+    Merge points into at most `target` equal-width time buckets
+
+    Every bucket keeps the open/close of its first/last point and the
+    min/max over all of them, so short spikes and dips survive.
+
+    Args:
+        points: History points, oldest first, with time, open, close, min, max and count
+        target: Maximum number of points returned
+
+    Returns:
+        Points of the same shape, oldest first
+    """
+    if len(points) <= target or target < 1:
+        return list(points)
+
+    times = [point_timestamp(point) for point in points]
+    first, last = times[0], times[-1]
+    width = (last - first) / target or 1.0
+
+    buckets = []
+    current_index = None
+    for moment, point in zip(times, points):
+        index = min(int((moment - first) / width), target - 1)
+        if index != current_index:
+            buckets.append(dict(point))
+            current_index = index
+            continue
+        bucket = buckets[-1]
+        bucket['close'] = point['close']
+        bucket['min'] = min(bucket['min'], point['min'])
+        bucket['max'] = max(bucket['max'], point['max'])
+        bucket['count'] += point['count']
+    return buckets
+
+
+def lttb(points: List[Dict], target: int) -> List[Dict]:
+    """
+    Pick `target` points with Largest-Triangle-Three-Buckets on (time, close)
+
+    The first and last points are always kept; from every bucket in between
+    the point forming the largest triangle with the previously kept point
+    and the next bucket's average is chosen, which keeps the chart's shape.
+
+    Returns:
+        Subset of `points`, oldest first
+    """
+    if len(points) <= target:
+        return list(points)
+    if target < 3:
+        # No buckets between the endpoints; with a single point keep the newest
+        return [points[0], points[-1]][-target:] if target > 0 else []
+
+    xs = [point_timestamp(point) for point in points]
+    ys = [point['close'] for point in points]
+    size = (len(points) - 2) / (target - 2)
+
+    selected = [points[0]]
+    previous = 0
+    for bucket in range(target - 2):
+        start = int(bucket * size) + 1
+        end = int((bucket + 1) * size) + 1
+
+        # Average of the next bucket (the last point for the final one)
+        next_start = end
+        next_end = min(int((bucket + 2) * size) + 1, len(points))
+        if next_start >= next_end:
+            next_start, next_end = len(points) - 1, len(points)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((xs[previous] - avg_x) * (ys[i] - ys[previous])
+                       - (xs[previous] - xs[i]) * (avg_y - ys[previous]))
+            if area > best_area:
+                best, best_area = i, area
+
+        selected.append(points[best])
+        previous = best
+
+    selected.append(points[-1])
+    return selected
+
+
+def downsample(points: List[Dict], target: int, method: str = "minmax") -> List[Dict]:
+    """Reduce history points to about `target` with the given method ("minmax" or "lttb")"""
+    if method == "minmax":
+        return minmax(points, target)
+    if method == "lttb":
+        return lttb(points, target)
+    raise ValueError(f"Unknown downsampling method: {method}")
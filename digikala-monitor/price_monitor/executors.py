@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from .metrics import EXECUTOR_QUEUE_DEPTH
+
+
+class AsyncFacade:
+    """Runs the blocking methods of an object on a dedicated thread pool
+
+    `await facade.update_price(...)` calls `target.update_price(...)` on the
+    facade's own executor, so slow SQLite or SMTP calls never stall the
+    event loop. Queue depth, wait time (submit to start) and run time are
+    recorded; the total run time is loop blocking that was avoided.
+    """
+
+    def __init__(self, target, name: str, max_workers: int = 1):
+        """
+        Initialize facade
+
+        Args:
+            target: Object whose methods are blocking (e.g. PriceDatabase)
+            name: Label used for the executor threads and in stats
+            max_workers: Threads of the dedicated executor
+        """
+        self.target = target
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self._depth_gauge = EXECUTOR_QUEUE_DEPTH.labels(executor=name)
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls submitted but not finished yet (queued or running)"""
+        return self.submitted - self.completed
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    async def run(self, func, *args, **kwargs):
+        """Run `func(*args, **kwargs)` on the executor and await its result"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+            self._depth_gauge.set(self.submitted - self.completed)
+
+        def job():
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finished_at = time.perf_counter()
+                wait = started_at - submitted_at
+                with self._lock:
+                    self.completed += 1
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    self.total_run += finished_at - started_at
+                    self._depth_gauge.set(self.submitted - self.completed)
+
+        return await loop.run_in_executor(self._executor, job)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            completed = self.completed
+            return {
+                'workers': self.max_workers,
+                'queue_depth': self.submitted - completed,
+                'submitted': self.submitted,
+                'completed': completed,
+                'avg_wait_ms': (self.total_wait / completed * 1000) if completed else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'avg_run_ms': (self.total_run / completed * 1000) if completed else 0.0,
+                'offloaded_seconds': self.total_run
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,182 @@
+import asyncio
+import csv
+import io
+import itertools
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .timeutils import utc_now
+from .urls import clean_url, is_product_url, product_key
+
+
+_job_ids = itertools.count(1)
+
+# Failed URLs kept in the progress report
+MAX_REPORTED_FAILURES = 100
+
+
+def parse_urls(text: str) -> Tuple[List[str], List[str]]:
+    """
+    Pull product links out of pasted text or a CSV file
+
+    Every cell of every line is looked at (one URL per line, comma
+    separated lists and CSV exports with extra columns all work). Cells
+    that do not look like links, such as headers, names or prices, are
+    ignored.
+
+    Args:
+        text: Uploaded or pasted content
+
+    Returns:
+        (product urls in order of appearance, links that are not Digikala products)
+    """
+    urls, invalid = [], []
+    for row in csv.reader(io.StringIO(text)):
+        for cell in row:
+            for token in cell.split():
+                if '://' not in token and 'digikala' not in token:
+                    continue
+                if is_product_url(token):
+                    urls.append(clean_url(token))
+                else:
+                    invalid.append(token)
+    return urls, invalid
+
+
+class ProductImporter:
+    """Adds a list of products at once
+
+    The links are validated and deduplicated (by product id, see
+    `product_key`, also against products already monitored), scraped
+    concurrently through the scraper (and so its cache and rate limiter)
+    and inserted with a single `add_products_bulk` call. `progress` can be
+    read at any time while `run()` is going.
+    """
+
+    def __init__(self, database, scraper, concurrency: int = 4,
+                 next_check_in: Optional[float] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None):
+        """
+        Initialize importer
+
+        Args:
+            database: AsyncFacade around PriceDatabase
+            scraper: DigikalaScraper or TieredFetcher instance
+            concurrency: Products scraped at the same time
+            next_check_in: Seconds until the first scheduled check of the
+                imported products (they have just been scraped)
+            on_progress: Called with `progress` after every scraped product
+        """
+        self.db = database
+        self.scraper = scraper
+        self.concurrency = concurrency
+        self.next_check_in = next_check_in
+        self.on_progress = on_progress
+        self.id = next(_job_ids)
+        self.progress = {
+            'id': self.id,
+            'status': 'pending',
+            'received': 0,
+            'invalid': 0,
+            'duplicates': 0,
+            'existing': 0,
+            'to_scrape': 0,
+            'scraped': 0,
+            'failed': 0,
+            'added': 0,
+            'failed_urls': [],
+            'started_at': None,
+            'finished_at': None,
+            'duration': None,
+            'error': None
+        }
+
+    async def run(self, urls: Iterable[str], invalid: Iterable[str] = ()) -> Dict:
+        """
+        Import the products
+
+        Args:
+            urls: Product links, e.g. the first result of parse_urls()
+            invalid: Rejected entries, counted in the report
+
+        Returns:
+            The final progress report
+        """
+        progress = self.progress
+        progress['status'] = 'validating'
+        progress['started_at'] = utc_now().strftime("%Y-%m-%d %H:%M:%S")
+        started = time.monotonic()
+        try:
+            urls = list(urls)
+            progress['received'] = len(urls) + len(list(invalid))
+            progress['invalid'] = progress['received'] - len(urls)
+
+            todo = self._deduplicate(urls, await self.db.get_product_urls())
+            progress['status'] = 'scraping'
+            progress['to_scrape'] = len(todo)
+            print(f"📥 Import {self.id}: scraping {len(todo)} products "
+                  f"({progress['duplicates']} duplicates, {progress['existing']} already monitored, "
+                  f"{progress['invalid']} invalid)")
+
+            rows = await self._scrape_all(todo)
+
+            progress['status'] = 'saving'
+            if rows:
+                result = await self.db.add_products_bulk(rows, self.next_check_in)
+                progress['added'] = result['added']
+                progress['existing'] += result['existing']
+            progress['status'] = 'done'
+        except Exception as e:
+            progress['status'] = 'failed'
+            progress['error'] = str(e)
+            print(f"❌ Import {self.id} failed: {e}")
+        finally:
+            progress['finished_at'] = utc_now().strftime("%Y-%m-%d %H:%M:%S")
+            progress['duration'] = round(time.monotonic() - started, 3)
+            self._report()
+
+        print(f"📥 Import {self.id} {progress['status']}: {progress['added']} added, "
+              f"{progress['failed']} failed in {progress['duration']:.1f}s")
+        return progress
+
+    def _deduplicate(self, urls: List[str], existing_urls: List[str]) -> List[str]:
+        known = {product_key(url) for url in existing_urls}
+        seen = set()
+        todo = []
+        for url in urls:
+            key = product_key(url)
+            if key in seen:
+                self.progress['duplicates'] += 1
+            elif key in known:
+                self.progress['existing'] += 1
+            else:
+                todo.append(url)
+            seen.add(key)
+        return todo
+
+    async def _scrape_all(self, urls: List[str]) -> List[Tuple[str, str, int]]:
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        rows = []
+
+        async def scrape(url):
+            async with semaphore:
+                try:
+                    info = await self.scraper.scrape_product(url)
+                except Exception as e:
+                    print(f"❌ Error scraping {url}: {e}")
+                    info = None
+            if info:
+                rows.append((url, info['name'], info['price']))
+                self.progress['scraped'] += 1
+            else:
+                self.progress['failed'] += 1
+                if len(self.progress['failed_urls']) < MAX_REPORTED_FAILURES:
+                    self.progress['failed_urls'].append(url)
+            self._report()
+
+        await asyncio.gather(*(scrape(url) for url in urls))
+        return rows
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(self.progress)
@@ -0,0 +1,116 @@
+from typing import Dict, List
+
+
+class SQLiteLeaseBackend:
+    """Work leases kept in the `product_leases` table of the price database
+
+    Claims run in one BEGIN IMMEDIATE transaction, so worker processes on
+    the same machine never lease the same product twice.
+    """
+
+    def __init__(self, database, lease_seconds: int = 300):
+        """
+        Initialize backend
+
+        Args:
+            database: PriceDatabase the products and leases live in
+            lease_seconds: How long a claimed product stays reserved
+        """
+        self.db = database
+        self.lease_seconds = lease_seconds
+
+    def claim(self, owner: str, limit: int) -> List[Dict]:
+        """Lease up to `limit` due products to `owner`"""
+        return self.db.claim_due_products(owner, limit, self.lease_seconds)
+
+    def release(self, owner: str, products: List[Dict]):
+        """Give the products back once their results are saved"""
+        self.db.release_products(owner, [product['id'] for product in products])
+
+
+class RedisLeaseBackend:
+    """Work leases kept in Redis instead of the price database
+
+    Every lease is a `SET <prefix><product id> <owner> NX EX <lease_seconds>`
+    key, so it disappears on its own if the worker holding it dies, and
+    claims no longer take SQLite's write lock. Due products are still read
+    from (and results written to) the price database, a WAL-mode SQLite
+    file that must stay on a local disk: this backend does not let workers
+    run on other machines.
+    """
+
+    # Delete a lease only if it still belongs to the caller
+    RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, database, redis_url: str = "redis://localhost:6379/0",
+                 lease_seconds: int = 300, key_prefix: str = "price_monitor:lease:",
+                 candidates_factor: int = 4, client=None):
+        """
+        Initialize backend
+
+        Args:
+            database: PriceDatabase the due products are read from
+            redis_url: Redis connection URL
+            lease_seconds: How long a claimed product stays reserved
+            key_prefix: Prefix of the lease keys
+            candidates_factor: Due products read per claim, as a multiple of
+                the batch size, since some are leased by other workers
+            client: Ready Redis client to use instead of connecting to `redis_url`
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis lease backend needs the 'redis' package "
+                                  "(pip install redis)")
+            client = redis.Redis.from_url(redis_url)
+        self.db = database
+        self.redis = client
+        self.lease_seconds = lease_seconds
+        self.key_prefix = key_prefix
+        self.candidates_factor = candidates_factor
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+
+    def claim(self, owner: str, limit: int) -> List[Dict]:
+        """Lease up to `limit` due products to `owner`"""
+        claimed = []
+        for product in self.db.get_due_products(limit * self.candidates_factor):
+            if self.redis.set(self._key(product), owner, nx=True, ex=self.lease_seconds):
+                claimed.append(product)
+                if len(claimed) >= limit:
+                    break
+        return claimed
+
+    def release(self, owner: str, products: List[Dict]):
+        """Give the products back once their results are saved"""
+        for product in products:
+            self._release(keys=[self._key(product)], args=[owner])
+
+    def _key(self, product: Dict) -> str:
+        return f"{self.key_prefix}{product['id']}"
+
+
+def create_lease_backend(database, backend: str = "sqlite", lease_seconds: int = 300,
+                         redis_url: str = "redis://localhost:6379/0"):
+    """
+    Build a lease backend by name
+
+    Args:
+        database: PriceDatabase instance
+        backend: "sqlite" or "redis" (leases only; workers stay on the database's host)
+        lease_seconds: How long a claimed product stays reserved
+        redis_url: Redis connection URL, for the redis backend
+
+    Returns:
+        SQLiteLeaseBackend or RedisLeaseBackend
+    """
+    if backend == "sqlite":
+        return SQLiteLeaseBackend(database, lease_seconds)
+    if backend == "redis":
+        return RedisLeaseBackend(database, redis_url, lease_seconds)
+    raise ValueError(f"Unknown lease backend: {backend}")
@@ -1,15 +1,42 @@
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict
+from typing import Dict, List, Optional
+
+from .metrics import STAGE_SECONDS
+
+
+# The server answered and rejected the message itself; reconnecting and resending cannot help
+REJECTED_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """True for a 5xx rejection of the message, which will fail the same way on every retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
 
 
 class EmailNotifier:
-    """Sends email notifications for price drops"""
+    """Sends email notifications for price drops
+    
+    One authenticated SMTP session is kept open and reused for every
+    message; it is checked with NOOP after `keepalive` idle seconds and
+    re-established if the server dropped it. In digest mode the outbox
+    sender groups pending drops into a single message (see send_digest).
+    """
+    
+    DIGEST_MODES = ("off", "sweep", "window")
     
     def __init__(self, smtp_server: str, smtp_port: int, 
                  sender_email: str, sender_password: str, 
-                 recipient_email: str):
+                 recipient_email: str, use_tls: bool = True,
+                 timeout: float = 30, keepalive: float = 60,
+                 digest_mode: str = "off", digest_window: float = 600):
         """
         Initialize email notifier
         
@@ -19,19 +46,128 @@ class EmailNotifier:
             sender_email: Sender email address
             sender_password: Sender email password (use App Password for Gmail)
             recipient_email: Recipient email address
+            use_tls: Upgrade the connection with STARTTLS
+            timeout: Socket timeout of the SMTP connection in seconds
+            keepalive: Idle seconds after which the session is checked with NOOP
+            digest_mode: "off" sends one email per drop, "sweep" one email per
+                price check, "window" one email per `digest_window` seconds
+            digest_window: Seconds between digests in "window" mode
         """
+        if digest_mode not in self.DIGEST_MODES:
+            raise ValueError(f"Unknown digest_mode: {digest_mode}")
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.sender_email = sender_email
         self.sender_password = sender_password
         self.recipient_email = recipient_email
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.digest_mode = digest_mode
+        self.digest_window = digest_window
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self.last_error = None
+        # Whether the last failure was a permanent rejection (see is_permanent_failure)
+        self.last_error_permanent = False
+        self.stats = {'messages': 0, 'connections': 0, 'reconnects': 0, 'failures': 0}
+    
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.sender_password:
+            server.login(self.sender_email, self.sender_password)
+        self.stats['connections'] += 1
+        return server
+    
+    def _get_server(self) -> smtplib.SMTP:
+        """Return the open session, reconnecting if it went stale"""
+        if self._server is not None and time.monotonic() - self._last_used > self.keepalive:
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self._drop_server()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+    
+    def _drop_server(self):
+        try:
+            self._server.close()
+        except Exception:
+            pass
+        self._server = None
+    
+    def _deliver(self, message: MIMEMultipart):
+        """Send a message over the pooled session, retrying once on a dropped connection"""
+        with self._lock:
+            with STAGE_SECONDS.labels(stage='email_send').time():
+                try:
+                    self._get_server().send_message(message)
+                except REJECTED_ERRORS:
+                    raise
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+                    self._drop_server()
+                    self.stats['reconnects'] += 1
+                    self._get_server().send_message(message)
+            self._last_used = time.monotonic()
+            self.stats['messages'] += 1
+    
+    def close(self):
+        """Quit the pooled SMTP session"""
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except Exception:
+                    pass
+                self._server = None
+    
+    def send_digest(self, drops: List[Dict], message_id: Optional[str] = None) -> bool:
+        """
+        Send several price drops in a single email
+        
+        Args:
+            drops: Price drop dicts, as passed to send_price_drop_notification
+            message_id: Optional Message-ID so a resent email can be recognised
+        
+        Returns:
+            True if email sent successfully, False otherwise
+        """
+        if len(drops) == 1:
+            return self.send_price_drop_notification(drops[0], message_id)
+        
+        try:
+            message = MIMEMultipart("alternative")
+            message["Subject"] = f"🔔 کاهش قیمت {len(drops)} محصول"
+            message["From"] = self.sender_email
+            message["To"] = self.recipient_email
+            if message_id:
+                message["Message-ID"] = message_id
+            
+            message.attach(MIMEText(self._create_digest_text_body(drops), "plain", "utf-8"))
+            message.attach(MIMEText(self._create_digest_html_body(drops), "html", "utf-8"))
+            
+            self._deliver(message)
+            
+            print(f"✅ Digest email sent for {len(drops)} products")
+            return True
+        
+        except Exception as e:
+            self._record_failure(e)
+            print(f"❌ Error sending digest email: {e}")
+            return False
     
-    def send_price_drop_notification(self, product_info: Dict) -> bool:
+    def send_price_drop_notification(self, product_info: Dict,
+                                     message_id: Optional[str] = None) -> bool:
         """
         Send email notification about price drop
         
         Args:
             product_info: Dict containing product details and price drop info
+            message_id: Optional Message-ID so a resent email can be recognised
             
         Returns:
             True if email sent successfully, False otherwise
@@ -42,6 +178,8 @@ class EmailNotifier:
             message["Subject"] = f"🔔 کاهش قیمت: {product_info['name']}"
             message["From"] = self.sender_email
             message["To"] = self.recipient_email
+            if message_id:
+                message["Message-ID"] = message_id
             
             # Create HTML email body
             html_body = self._create_html_body(product_info)
@@ -57,17 +195,20 @@ class EmailNotifier:
             message.attach(part2)
             
             # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(message)
+            self._deliver(message)
             
             print(f"✅ Email sent for: {product_info['name']}")
             return True
             
         except Exception as e:
+            self._record_failure(e)
             print(f"❌ Error sending email: {e}")
             return False
+
+    def _record_failure(self, error: Exception):
+        self.stats['failures'] += 1
+        self.last_error = str(error)
+        self.last_error_permanent = is_permanent_failure(error)
     
     def _create_text_body(self, info: Dict) -> str:
         """Create plain text email body"""
@@ -88,6 +229,59 @@ class EmailNotifier:
 سیستم نظارت قیمت دیجیکالا
         """
     
+    def _create_digest_text_body(self, drops: List[Dict]) -> str:
+        """Create plain text body listing several price drops"""
+        lines = [f"کاهش قیمت {len(drops)} محصول دیجیکالا!", ""]
+        for info in drops:
+            lines.append(f"محصول: {info['name']}")
+            lines.append(f"{info['old_price']:,} ← {info['new_price']:,} تومان "
+                         f"(-{info['price_drop']:,} تومان، {info['drop_percentage']:.1f}%)")
+            lines.append(info['url'])
+            lines.append("")
+        lines.append("---")
+        lines.append("سیستم نظارت قیمت دیجیکالا")
+        return "\n".join(lines)
+    
+    def _create_digest_html_body(self, drops: List[Dict]) -> str:
+        """Create HTML body listing several price drops"""
+        rows = "".join(f"""
+            <tr>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">
+                    <a href="{info['url']}" style="color: #333; text-decoration: none; font-weight: bold;">{info['name']}</a>
+                </td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; color: #999; text-decoration: line-through;">{info['old_price']:,}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; color: #e6123d; font-weight: bold;">{info['new_price']:,}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; color: #155724;">{info['drop_percentage']:.1f}%</td>
+            </tr>""" for info in drops)
+        
+        return f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+</head>
+<body style="font-family: Tahoma, Arial, sans-serif; direction: rtl; text-align: right; background-color: #f5f5f5; padding: 20px;">
+    <div style="background-color: white; border-radius: 10px; padding: 30px; max-width: 700px; margin: 0 auto;">
+        <div style="background-color: #e6123d; color: white; padding: 20px; border-radius: 8px; text-align: center;">
+            <h1>🔔 کاهش قیمت {len(drops)} محصول!</h1>
+        </div>
+        <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
+            <tr>
+                <th style="padding: 10px; text-align: right;">محصول</th>
+                <th style="padding: 10px; text-align: right;">قیمت قبلی</th>
+                <th style="padding: 10px; text-align: right;">قیمت جدید</th>
+                <th style="padding: 10px; text-align: right;">کاهش</th>
+            </tr>
+            {rows}
+        </table>
+        <div style="text-align: center; color: #999; font-size: 12px; margin-top: 30px;">
+            سیستم نظارت قیمت دیجیکالا
+        </div>
+    </div>
+</body>
+</html>
+        """
+    
     def _create_html_body(self, info: Dict) -> str:
         """Create HTML email body"""
         return f"""
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Dict, List, Optional
+
+from .metrics import EMAILS
+
+
+class OutboxSender:
+    """Delivers price-drop emails from the database outbox in the background
+
+    Drops are written to `notification_outbox` together with the price
+    update, so they survive restarts. This sender claims due entries,
+    sends them (one email each, or one digest when the notifier's
+    digest_mode is on), and reschedules failures with exponential backoff
+    until `max_attempts` is reached. A minimum gap between emails keeps
+    the provider's rate limits happy.
+    """
+
+    def __init__(self, database, notifier, poll_interval: float = 10,
+                 batch_size: int = 20, max_attempts: int = 8,
+                 base_backoff: float = 30, max_backoff: float = 3600,
+                 rate_limit_per_minute: float = 20, lease_seconds: int = 300,
+                 woken_by_sweeps: bool = True):
+        """
+        Initialize sender
+
+        Args:
+            database: PriceDatabase, or an AsyncFacade around it
+            notifier: EmailNotifier, or an AsyncFacade around it
+            poll_interval: Seconds between outbox checks when digests are off
+            batch_size: Entries claimed per check when digests are off
+            max_attempts: Delivery attempts before an entry is given up ("dead")
+            base_backoff: Delay after the first failure; doubles on each retry
+            max_backoff: Upper bound of the retry delay
+            rate_limit_per_minute: Maximum emails sent per minute
+            lease_seconds: How long a claimed entry is reserved for this sender
+            woken_by_sweeps: The scheduler calls wake() after each sweep; when
+                False (worker processes sweep), "sweep" digests are polled
+                every poll_interval instead
+        """
+        self.db = database
+        self.notifier = notifier
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_send_gap = 60.0 / rate_limit_per_minute if rate_limit_per_minute else 0.0
+        self.lease_seconds = lease_seconds
+        self.woken_by_sweeps = woken_by_sweeps
+        self.is_running = False
+        self.stats = {'sent': 0, 'failed': 0, 'dead': 0, 'emails': 0}
+        self._wakeup = None
+        self._next_send_at = 0.0
+
+    async def run(self):
+        """Drain the outbox until stop() is called"""
+        self.is_running = True
+        self._wakeup = asyncio.Event()
+        print("📬 Notification outbox sender started")
+
+        while self.is_running:
+            try:
+                while await self.drain_once():
+                    pass
+            except Exception as e:
+                print(f"❌ Error draining notification outbox: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._wait_timeout())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def wake(self):
+        """Check the outbox now (e.g. after a sweep saved new drops)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stop(self):
+        self.is_running = False
+        self.wake()
+
+    def _wait_timeout(self) -> Optional[float]:
+        mode = self.notifier.digest_mode
+        if mode == "sweep" and self.woken_by_sweeps:
+            # The scheduler wakes the sender at the end of every sweep
+            return None
+        if mode == "window":
+            return self.notifier.digest_window
+        return self.poll_interval
+
+    async def drain_once(self) -> int:
+        """
+        Claim due entries and try to deliver them
+
+        With digests on, every due entry is claimed and sent as a single
+        digest (one sweep or window = one email); otherwise one batch of
+        `batch_size` entries is sent one email each.
+
+        Returns:
+            Number of entries claimed (0 when nothing was due)
+        """
+        digest = self.notifier.digest_mode != "off"
+        entries = await self.db.claim_due_notifications(
+            None if digest else self.batch_size, self.lease_seconds
+        )
+        if not entries:
+            return 0
+
+        if digest:
+            await self._deliver(entries)
+        else:
+            for entry in entries:
+                await self._deliver([entry])
+        return len(entries)
+
+    async def _deliver(self, entries: List[Dict]):
+        await self._respect_rate_limit()
+
+        keys = ",".join(entry['idempotency_key'] for entry in entries)
+        message_id = f"<{hashlib.sha1(keys.encode()).hexdigest()}@digikala-price-monitor>"
+        ids = [entry['id'] for entry in entries]
+
+        if await self.notifier.send_digest([entry['payload'] for entry in entries], message_id):
+            await self.db.mark_notifications_sent(ids)
+            self.stats['sent'] += len(entries)
+            self.stats['emails'] += 1
+            EMAILS.labels(result='sent').inc()
+            return
+
+        error = self.notifier.last_error or "send failed"
+        attempts = max(entry['attempts'] for entry in entries)
+        if self.notifier.last_error_permanent:
+            # Rejected by the server (e.g. unknown recipient): retrying sends the same thing
+            await self.db.mark_notifications_failed(ids, error, None)
+            self.stats['dead'] += len(entries)
+            EMAILS.labels(result='dead').inc()
+            print(f"☠️ {len(entries)} notifications rejected by the mail server: {error}")
+        elif attempts >= self.max_attempts:
+            await self.db.mark_notifications_failed(ids, error, None)
+            self.stats['dead'] += len(entries)
+            EMAILS.labels(result='dead').inc()
+            print(f"☠️ Giving up on {len(entries)} notifications after {attempts} attempts")
+        else:
+            retry_in = self._backoff(attempts)
+            await self.db.mark_notifications_failed(ids, error, retry_in)
+            self.stats['failed'] += len(entries)
+            EMAILS.labels(result='failed').inc()
+            print(f"🔁 Retrying {len(entries)} notifications in {retry_in:.0f}s")
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        # Jitter so entries that failed together do not retry in lockstep
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _respect_rate_limit(self):
+        now = time.monotonic()
+        if now < self._next_send_at:
+            await asyncio.sleep(self._next_send_at - now)
+        self._next_send_at = max(now, self._next_send_at) + self.min_send_gap
@@ -0,0 +1,284 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from .metrics import CIRCUIT_OPEN, HOST_RATE, HOST_REQUESTS, RATE_LIMIT_WAIT_SECONDS
+
+
+# Outcomes passed to HostRateLimiter.record
+SUCCESS = 'success'
+FAILURES = ('error', 'timeout', 'throttled', 'blocked')
+
+
+def outcome_for_status(status: int) -> str:
+    """Classify an HTTP status for the rate limiter (404 etc. still mean the host is fine)"""
+    if status in (403, 429):
+        return 'throttled'
+    if status >= 500:
+        return 'error'
+    return SUCCESS
+
+
+class TokenBucket:
+    """Token bucket that hands out waiting times instead of blocking
+
+    Tokens may go negative: every caller reserves its token right away and
+    sleeps for the returned delay, so waiting requests are served in order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take one token, returns the seconds to wait before using it"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate: float):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+
+class CircuitBreaker:
+    """Stops requests to a host while too many of them fail
+
+    Closed: requests pass and their outcomes fill a sliding window. Once
+    the window holds `min_requests` outcomes and the failure ratio reaches
+    `failure_threshold`, the breaker opens for `cooldown` seconds. After
+    that a single probe request is let through (half-open): success closes
+    the breaker, failure opens it again with twice the cooldown, up to
+    `max_cooldown`.
+    """
+
+    def __init__(self, failure_threshold: float = 0.5, window: int = 20,
+                 min_requests: int = 10, cooldown: float = 60, max_cooldown: float = 900):
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.open_until = 0.0
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+
+    @property
+    def failure_ratio(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a request may pass, 0 if it may pass now
+
+        In the half-open state the first caller becomes the probe; the others
+        keep waiting until its outcome is recorded.
+        """
+        if self.state == 'closed':
+            return 0.0
+        now = time.monotonic()
+        if self.state == 'open':
+            if now < self.open_until:
+                return self.open_until - now
+            self.state = 'half_open'
+            self._probing = False
+        if self._probing:
+            return min(1.0, self.cooldown)
+        self._probing = True
+        return 0.0
+
+    def record(self, ok: bool) -> bool:
+        """
+        Feed one request outcome
+
+        Returns:
+            True if this outcome opened the breaker
+        """
+        if self.state == 'half_open':
+            self._probing = False
+            if ok:
+                self.state = 'closed'
+                self.cooldown = self.base_cooldown
+                self._outcomes.clear()
+                return False
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            return self._open()
+
+        if self.state == 'open':
+            # Requests that started before the breaker opened
+            return False
+
+        self._outcomes.append(ok)
+        if len(self._outcomes) >= self.min_requests and self.failure_ratio >= self.failure_threshold:
+            return self._open()
+        return False
+
+    def _open(self) -> bool:
+        self.state = 'open'
+        self.open_until = time.monotonic() + self.cooldown
+        self.opened += 1
+        self._outcomes.clear()
+        return True
+
+
+class _Host:
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker):
+        self.bucket = bucket
+        self.breaker = breaker
+        self.last_decrease = 0.0
+        self.stats = {'requests': 0, 'failures': 0, 'waited_seconds': 0.0}
+
+
+class HostRateLimiter:
+    """Shared per-host rate limit with adaptive (AIMD) backoff and a circuit breaker
+
+    Every host gets a token bucket starting at `rate` requests per second.
+    Each successful request raises the rate by `increase_step` (up to
+    `max_rate`); an error, timeout, 403/429 or captcha page multiplies it
+    by `decrease_factor` (down to `min_rate`), at most once per
+    `decrease_interval` so a burst of failures counts once. A per-host
+    CircuitBreaker pauses all requests to the host while the failure
+    ratio is too high, which pauses the sweep until Digikala recovers.
+
+    All calls must come from one event loop (TieredFetcher's).
+    """
+
+    def __init__(self, rate: float = 2.0, burst: float = 5, min_rate: float = 0.2,
+                 max_rate: float = 10.0, increase_step: float = 0.05,
+                 decrease_factor: float = 0.5, decrease_interval: float = 2.0,
+                 failure_threshold: float = 0.5, window: int = 20, min_requests: int = 10,
+                 cooldown: float = 60, max_cooldown: float = 900):
+        """
+        Initialize rate limiter
+
+        Args:
+            rate: Starting requests per second per host
+            burst: Requests a host may receive at once after being idle
+            min_rate: Lowest rate the backoff may reach
+            max_rate: Highest rate successful requests may reach
+            increase_step: Rate added after each successful request
+            decrease_factor: Rate multiplier after a failed request
+            decrease_interval: Minimum seconds between two rate decreases
+            failure_threshold: Failure ratio that opens the circuit breaker
+            window: Number of recent requests the failure ratio is computed over
+            min_requests: Requests needed in the window before the breaker can open
+            cooldown: Seconds the breaker stays open the first time
+            max_cooldown: Upper bound of the doubling cooldown
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.breaker_options = {
+            'failure_threshold': failure_threshold,
+            'window': window,
+            'min_requests': min_requests,
+            'cooldown': cooldown,
+            'max_cooldown': max_cooldown
+        }
+        self._hosts: Dict[str, _Host] = {}
+
+    def _host(self, url: str) -> _Host:
+        host = urlparse(url).netloc
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = _Host(
+                TokenBucket(self.rate, self.burst),
+                CircuitBreaker(**self.breaker_options)
+            )
+            HOST_RATE.labels(host=host).set(self.rate)
+            CIRCUIT_OPEN.labels(host=host).set(0)
+        return entry
+
+    async def acquire(self, url: str):
+        """Wait until a request to the host of `url` may be sent"""
+        entry = self._host(url)
+        host = urlparse(url).netloc
+        waited = 0.0
+        while True:
+            delay = entry.breaker.wait_time()
+            if not delay:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+
+        delay = entry.bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+            waited += delay
+
+        entry.stats['requests'] += 1
+        if waited:
+            entry.stats['waited_seconds'] += waited
+            RATE_LIMIT_WAIT_SECONDS.labels(host=host).inc(waited)
+
+    def record(self, url: str, outcome: str):
+        """
+        Report how a request acquired for `url` went
+
+        Args:
+            url: Request URL
+            outcome: 'success', or one of 'error', 'timeout', 'throttled', 'blocked'
+        """
+        entry = self._host(url)
+        host = urlparse(url).netloc
+        ok = outcome not in FAILURES
+        HOST_REQUESTS.labels(host=host, outcome=outcome).inc()
+
+        bucket = entry.bucket
+        if ok:
+            bucket.set_rate(min(self.max_rate, bucket.rate + self.increase_step))
+        else:
+            entry.stats['failures'] += 1
+            now = time.monotonic()
+            if now - entry.last_decrease >= self.decrease_interval:
+                entry.last_decrease = now
+                bucket.set_rate(max(self.min_rate, bucket.rate * self.decrease_factor))
+        HOST_RATE.labels(host=host).set(bucket.rate)
+
+        if entry.breaker.record(ok):
+            print(f"🛑 Too many failures from {host}, pausing requests for {entry.breaker.cooldown:.0f}s")
+        CIRCUIT_OPEN.labels(host=host).set(1 if entry.breaker.state == 'open' else 0)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Current rate, breaker state and counters per host"""
+        return {
+            host: dict(
+                entry.stats,
+                waited_seconds=round(entry.stats['waited_seconds'], 3),
+                rate=round(entry.bucket.rate, 3),
+                circuit=entry.breaker.state,
+                failure_ratio=round(entry.breaker.failure_ratio, 3),
+                circuit_opened=entry.breaker.opened
+            )
+            for host, entry in self._hosts.items()
+        }
+
+
+def create_rate_limiter(enabled: bool = True, **options) -> Optional[HostRateLimiter]:
+    """
+    Build the rate limiter from RATE_LIMIT_CONFIG
+
+    Args:
+        enabled: False to send requests without any limit
+        **options: HostRateLimiter arguments
+
+    Returns:
+        HostRateLimiter, or None when disabled
+    """
+    return HostRateLimiter(**options) if enabled else None
@@ -1,57 +1,456 @@
 import asyncio
-from datetime import datetime
+import heapq
+import itertools
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .executors import AsyncFacade
+from .metrics import CHECKS, SCHEDULED_PRODUCTS, SWEEP_SECONDS, SWEEPS
+from .outbox import OutboxSender
+from .timeutils import utc_now
 
 class PriceScheduler:
-    """Schedules periodic price checks"""
+    """Schedules periodic price checks
+    
+    Products wait in a heap ordered by their `next_check_at`; every wake-up
+    checks the products that are due. In adaptive mode a product's interval
+    halves when its price changed and grows by `backoff_factor` when it did
+    not, within [min_interval, max_interval]. A per-product
+    `interval_override` in the database pins the interval.
+
+    Products queued by /add (see PriceDatabase.enqueue_add_job) are
+    scraped by a background task next to the sweeps, as soon as
+    wake_add_jobs() is called or within `add_job_poll` seconds.
+
+    pause(), resume() and check_now() steer the sweeps; price_monitor.control
+    exposes them (and status()) to other processes.
+    """
+
+    # Pause after an error in the main loop before trying again
+    ERROR_RETRY_SECONDS = 30
     
-    def __init__(self, database, scraper, notifier, check_interval: int = 60):
+    def __init__(self, database, scraper, notifier, check_interval: int = 60,
+                 max_workers: int = 4, product_delay: float = 0,
+                 flush_size: int = 25, prune_interval: int = 3600,
+                 email_workers: int = 2, outbox_options: Optional[Dict] = None,
+                 adaptive: bool = False, min_interval: int = 60,
+                 max_interval: int = 6 * 3600, backoff_factor: float = 1.5,
+                 schedule_refresh: Optional[int] = None, run_checks: bool = True,
+                 add_job_poll: float = 30):
         """
         Initialize scheduler
         
         Args:
             database: PriceDatabase instance
-            scraper: DigikalaScraper instance
+            scraper: DigikalaScraper or TieredFetcher instance
             notifier: EmailNotifier instance
-            check_interval: Seconds between checks (default: 60 = 1 minute)
+            check_interval: Seconds between checks (default: 60 = 1 minute);
+                the starting interval of every product in adaptive mode
+            max_workers: Products checked concurrently during a sweep
+            product_delay: Extra seconds a worker pauses after each product;
+                request pacing is the fetcher's rate limiter's job
+            flush_size: Scraped prices written to the database per transaction
+            prune_interval: Seconds between history retention runs
+            email_workers: Threads sending notification emails
+            outbox_options: Keyword arguments for the OutboxSender
+            adaptive: Adapt each product's interval to how often its price changes
+            min_interval: Shortest adaptive interval in seconds
+            max_interval: Longest adaptive interval in seconds
+            backoff_factor: Interval growth after a check without a change
+            schedule_refresh: Seconds between reloads of the schedule from the
+                database, to pick up new products and overrides (default: check_interval)
+            run_checks: Check prices in this process; False when worker processes
+                (see price_monitor.worker) do the checking and start() only
+                delivers the outbox and prunes history
+            add_job_poll: Seconds between checks for /add jobs when not woken up
         """
         self.db = database
         self.scraper = scraper
         self.notifier = notifier
+        # SQLite and SMTP calls block, so they run on dedicated executors
+        self.async_db = AsyncFacade(database, 'db', max_workers=1)
+        self.async_notifier = AsyncFacade(notifier, 'smtp', max_workers=email_workers)
+        # Drops go to the database outbox; this sender delivers them in the background
+        self.outbox = OutboxSender(self.async_db, self.async_notifier, woken_by_sweeps=run_checks,
+                                   **(outbox_options or {}))
+        self._outbox_task = None
         self.check_interval = check_interval
+        self.max_workers = max_workers
+        self.product_delay = product_delay
+        self.flush_size = flush_size
+        self.prune_interval = prune_interval
+        self._last_prune = None
         self.last_check_time = None
         self.is_running = False
+        self.sweep_in_progress = False
+        self.skipped_sweeps = 0
+        self.last_sweep = None
+        self.sweep_history = deque(maxlen=20)
+        self.adaptive = adaptive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.schedule_refresh = schedule_refresh or check_interval
+        self._heap = []
+        self._heap_counter = itertools.count()
+        self._next_refresh = 0.0
+        self.run_checks = run_checks
+        self.add_job_poll = add_job_poll
+        self.add_job_stats = {'done': 0, 'failed': 0}
+        self._add_jobs_task = None
+        self._add_jobs_wakeup = None
+        self._loop = None
+        self._wakeup = None
+        self.paused = False
     
     async def start(self):
         """Start the scheduler loop"""
         self.is_running = True
-        print(f"🔄 Scheduler started. Checking every {self.check_interval} seconds...")
+        if not self.run_checks:
+            print("🔄 Scheduler started. Prices are checked by worker processes...")
+        elif self.adaptive:
+            print(f"🔄 Scheduler started. Adaptive intervals between "
+                  f"{self.min_interval} and {self.max_interval} seconds...")
+        else:
+            print(f"🔄 Scheduler started. Checking every {self.check_interval} seconds...")
         
-        while self.is_running:
-            await self.check_all_products()
-            await asyncio.sleep(self.check_interval)
+        self._outbox_task = asyncio.ensure_future(self.outbox.run())
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._add_jobs_wakeup = asyncio.Event()
+        self._add_jobs_task = asyncio.ensure_future(self._run_add_jobs())
+        try:
+            while self.is_running:
+                try:
+                    if not self.run_checks or self.paused:
+                        await self._prune_history_if_due()
+                        await self._sleep(self.check_interval)
+                        continue
+
+                    if time.monotonic() >= self._next_refresh:
+                        await self._load_schedule()
+
+                    due = self._pop_due_products()
+                    if due:
+                        await self.check_products(due, requeue=True)
+                        await self._prune_history_if_due()
+
+                    await self._sleep(self._seconds_until_next_wakeup())
+                except Exception as e:
+                    # One failed sweep (e.g. the database is locked) must not end the scheduler
+                    print(f"❌ Scheduler error: {e}")
+                    await self._sleep(min(self.check_interval, self.ERROR_RETRY_SECONDS))
+        finally:
+            # Also ends _run_add_jobs when start() leaves on an error or cancellation
+            self.is_running = False
+            self._add_jobs_wakeup.set()
+            await self._add_jobs_task
+            await self.scraper.close()
+            self.outbox.stop()
+            await self._outbox_task
+            await self.async_notifier.close()
+            self.async_db.shutdown(wait=False)
+            self.async_notifier.shutdown(wait=False)
     
     def stop(self):
         """Stop the scheduler"""
         self.is_running = False
+        self.wake()
         print("⏹️ Scheduler stopped")
+
+    def wake(self):
+        """Interrupt the main loop's sleep; safe to call from any thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def pause(self):
+        """Start no new sweeps until resume() (a running sweep finishes)"""
+        self.paused = True
+        print("⏸️ Price checks paused")
+
+    def resume(self):
+        self.paused = False
+        self.wake()
+        print("▶️ Price checks resumed")
+
+    async def check_now(self) -> int:
+        """
+        Make every product due and wake the loop
+
+        With worker processes the products are picked up by the workers.
+
+        Returns:
+            Number of products scheduled
+        """
+        count = await self.async_db.make_all_products_due()
+        self._next_refresh = 0.0
+        self.wake()
+        return count
+
+    def status(self) -> Dict:
+        """Live state and stats of the scheduler and its fetcher (JSON serializable)"""
+        scraper = self.scraper
+        rate_limiter = getattr(scraper, 'rate_limiter', None)
+        return {
+            'running': self.is_running,
+            'paused': self.paused,
+            'run_checks': self.run_checks,
+            'sweep_in_progress': self.sweep_in_progress,
+            'scheduled_products': len(self._heap),
+            'last_check': self.last_check_time,
+            'last_sweep': self.last_sweep,
+            'skipped_sweeps': self.skipped_sweeps,
+            'add_jobs': self.add_job_stats,
+            'fetch_tiers': getattr(scraper, 'hit_rates', None),
+            'fetch_cache': (dict(scraper.cache_stats, hit_rate=scraper.cache_hit_rate)
+                            if hasattr(scraper, 'cache_stats') else None),
+            'rate_limit': rate_limiter.stats() if rate_limiter else None,
+            'executors': self.executor_stats()
+        }
+
+    def wake_add_jobs(self):
+        """Process queued /add jobs now; safe to call from any thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._add_jobs_wakeup.set)
+
+    async def _run_add_jobs(self):
+        """Scrape products queued by /add until the scheduler stops"""
+        while self.is_running:
+            try:
+                while self.is_running and await self.process_add_jobs():
+                    pass
+            except Exception as e:
+                print(f"❌ Error processing add jobs: {e}")
+            try:
+                await asyncio.wait_for(self._add_jobs_wakeup.wait(), self.add_job_poll)
+            except asyncio.TimeoutError:
+                pass
+            self._add_jobs_wakeup.clear()
+
+    async def process_add_jobs(self) -> int:
+        """
+        Scrape one batch of queued /add jobs with `max_workers` concurrent workers
+
+        Returns:
+            Number of jobs processed (0 when the queue is empty)
+        """
+        jobs = await self.async_db.claim_add_jobs(max(1, self.max_workers))
+        if not jobs:
+            return 0
+
+        async def scrape(job):
+            try:
+                info = await self.scraper.scrape_product(job['url'])
+            except Exception as e:
+                return job['id'], job['url'], None, str(e)
+            return job['id'], job['url'], info, None if info else "could not read name and price"
+
+        results = await asyncio.gather(*(scrape(job) for job in jobs))
+        await self.async_db.finish_add_jobs(results, self.check_interval)
+        for _, url, info, error in results:
+            if info:
+                self.add_job_stats['done'] += 1
+                print(f"✅ Added product: {info['name']}")
+            else:
+                self.add_job_stats['failed'] += 1
+                print(f"⚠️ Could not add {url}: {error}")
+        return len(jobs)
+    
+    async def _load_schedule(self):
+        """Rebuild the heap of (due time, product) from the database"""
+        products = await self.async_db.get_all_products()
+        now = time.time()
+        self._heap = []
+        for product in products:
+            heapq.heappush(self._heap, (self._due_time(product, now), next(self._heap_counter), product))
+        SCHEDULED_PRODUCTS.set(len(self._heap))
+        self._next_refresh = time.monotonic() + self.schedule_refresh
+    
+    @staticmethod
+    def _due_time(product: Dict, now: float) -> float:
+        if not product.get('next_check_at'):
+            return now
+        due = datetime.strptime(product['next_check_at'][:19], "%Y-%m-%d %H:%M:%S")
+        return due.replace(tzinfo=timezone.utc).timestamp()
     
-    async def check_all_products(self):
-        """Check prices for all monitored products"""
-        self.last_check_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n⏰ [{self.last_check_time}] Starting price check...")
+    def _pop_due_products(self) -> List[Dict]:
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        SCHEDULED_PRODUCTS.set(len(self._heap))
+        return due
+    
+    def _seconds_until_next_wakeup(self) -> float:
+        until_refresh = self._next_refresh - time.monotonic()
+        if self._heap:
+            until_due = self._heap[0][0] - time.time()
+            return max(0.5, min(until_due, until_refresh))
+        return max(0.5, until_refresh)
+    
+    def _reschedule(self, product: Dict, seconds: float):
+        """Put a checked product back on the heap"""
+        if self.is_running:
+            heapq.heappush(self._heap, (time.time() + seconds, next(self._heap_counter), product))
+            SCHEDULED_PRODUCTS.set(len(self._heap))
+    
+    def _next_interval(self, product: Dict, changed: bool) -> int:
+        """Seconds until a product's next check, given whether its price just changed"""
+        if product.get('interval_override'):
+            # Overrides stored before /priority validated them may be below the floor
+            return max(self.min_interval, product['interval_override'])
+        if not self.adaptive:
+            return self.check_interval
+        current = product.get('check_interval') or self.check_interval
+        if changed:
+            interval = current / 2
+        else:
+            interval = current * self.backoff_factor
+        return int(min(self.max_interval, max(self.min_interval, interval)))
+    
+    async def check_all_products(self) -> Optional[Dict]:
+        """Check prices for all monitored products now, ignoring their schedule"""
+        products = await self.async_db.get_all_products()
+        return await self.check_products(products)
+    
+    async def check_products(self, products: List[Dict], requeue: bool = False) -> Optional[Dict]:
+        """
+        Check prices for a list of products (one sweep)
+        
+        Products are checked by up to `max_workers` concurrent workers and the
+        scraped prices are saved in batches of `flush_size`. A sweep requested
+        while another one is still running is skipped.
+        
+        Args:
+            products: Product dicts as returned by PriceDatabase.get_all_products
+            requeue: Push the products back on the schedule heap (for products
+                that were popped from it)
+        
+        Returns:
+            Dict with timing and counts for the sweep, None if it did not run
+        """
+        if self.sweep_in_progress:
+            self.skipped_sweeps += 1
+            SWEEPS.labels(outcome='skipped').inc()
+            print("⏭️ Previous price check still running, skipping this one")
+            return None
+        
+        self.sweep_in_progress = True
+        started = time.monotonic()
+        try:
+            self.last_check_time = utc_now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"\n⏰ [{self.last_check_time}] Starting price check...")
+            
+            if not products:
+                print("ℹ️ No products to check")
+                return None
+            
+            semaphore = asyncio.Semaphore(max(1, self.max_workers))
+            pending = []
+            failed = []
+            
+            async def worker(product):
+                async with semaphore:
+                    new_price = await self._check_product(product)
+                CHECKS.labels(result='success' if new_price is not None else 'failure').inc()
+                if new_price is None:
+                    # Failures keep the product's current interval
+                    retry_in = (product.get('interval_override') or product.get('check_interval')
+                                or self.check_interval)
+                    failed.append((product['url'], retry_in))
+                    if requeue:
+                        self._reschedule(product, retry_in)
+                    return False
+                interval = self._next_interval(product, new_price != product.get('current_price'))
+                pending.append((product['url'], new_price, interval))
+                if requeue:
+                    self._reschedule(dict(product, current_price=new_price, check_interval=interval), interval)
+                if len(pending) >= self.flush_size:
+                    await self._flush_results(pending)
+                return True
+            
+            results = await asyncio.gather(*(worker(p) for p in products))
+            await self._flush_results(pending)
+            if failed:
+                await self.async_db.reschedule_products(failed)
+            if self.notifier.digest_mode != "window":
+                # "window" digests collect drops until the window closes
+                self.outbox.wake()
+            succeeded = sum(1 for ok in results if ok)
+            
+            sweep = {
+                'started_at': self.last_check_time,
+                'duration': time.monotonic() - started,
+                'products': len(products),
+                'succeeded': succeeded,
+                'failed': len(products) - succeeded,
+                'workers': self.max_workers
+            }
+            self.last_sweep = sweep
+            self.sweep_history.append(sweep)
+            SWEEP_SECONDS.observe(sweep['duration'])
+            SWEEPS.labels(outcome='completed').inc()
+            
+            print(f"✅ Price check completed for {len(products)} products "
+                  f"in {sweep['duration']:.1f}s ({sweep['failed']} failed)\n")
+            return sweep
+        finally:
+            self.sweep_in_progress = False
+    
+    def executor_stats(self) -> Dict:
+        """Queue depth and wait/run times of the database and email executors"""
+        return {
+            'db': self.async_db.stats(),
+            'smtp': self.async_notifier.stats()
+        }
+    
+    async def _prune_history_if_due(self):
+        """Apply the database retention policy every `prune_interval` seconds"""
+        now = time.monotonic()
+        if self._last_prune is not None and now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
         
-        products = self.db.get_all_products()
-        if not products:
-            print("ℹ️ No products to check")
+        try:
+            deleted = await self.async_db.prune_history()
+        except Exception as e:
+            print(f"❌ Error pruning price history: {e}")
+            return
+        if deleted['raw'] or deleted['hourly']:
+            print(f"🧹 Pruned {deleted['raw']:,} history rows and {deleted['hourly']:,} hourly rollups")
+    
+    async def _flush_results(self, pending: list):
+        """Save a batch of scraped prices in one transaction and queue drop notifications"""
+        if not pending:
             return
+        batch = pending[:]
+        del pending[:]
         
-        for product in products:
-            await self._check_product(product)
+        try:
+            drops = await self.async_db.update_prices_bulk(batch, enqueue_notifications=True)
+        except Exception as e:
+            print(f"❌ Error saving {len(batch)} prices: {e}")
+            return
         
-        print(f"✅ Price check completed for {len(products)} products\n")
+        print(f"💾 Saved {len(batch)} prices ({len(drops)} drops)")
+        for price_drop_info in drops:
+            print(f"📉 Price dropped: {price_drop_info['name']}")
+            print(f"   Old: {price_drop_info['old_price']:,} → New: {price_drop_info['new_price']:,}")
+        
+        if drops and self.notifier.digest_mode == "off":
+            self.outbox.wake()
     
-    async def _check_product(self, product: dict):
-        """Check price for a single product"""
+    async def _check_product(self, product: dict) -> Optional[int]:
+        """Scrape a single product, returns its new price or None on failure"""
         try:
             url = product['url']
             name = product['name']
@@ -63,24 +462,19 @@ class PriceScheduler:
             
             if not product_info:
                 print(f"⚠️ Failed to scrape: {name}")
-                return
+                return None
             
             new_price = product_info['price']
-            
-            # Update database and check for price drop
-            price_drop_info = self.db.update_price(url, new_price)
-            
-            if price_drop_info:
-                print(f"📉 Price dropped: {name}")
-                print(f"   Old: {price_drop_info['old_price']:,} → New: {price_drop_info['new_price']:,}")
-                self.notifier.send_price_drop_notification(price_drop_info)
-            else:
+            if new_price == product.get('current_price'):
                 print(f"✓ No price change: {name} ({new_price:,} تومان)")
             
-            await asyncio.sleep(1)
+            if self.product_delay:
+                await asyncio.sleep(self.product_delay)
+            return new_price
         
         except Exception as e:
             print(f"❌ Error checking {product['name']}: {e}")
+            return None
 
 
 # Example usage for standalone testing
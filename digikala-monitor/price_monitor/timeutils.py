@@ -0,0 +1,7 @@
+from datetime import datetime, timezone
+
+
+def utc_now() -> datetime:
+    """Current UTC time as a naive datetime, the form all stored timestamps use"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
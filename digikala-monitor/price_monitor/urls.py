@@ -0,0 +1,36 @@
+import re
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+
+PRODUCT_ID_RE = re.compile(r"dkp-(\d+)")
+
+
+def extract_product_id(url: str) -> Optional[str]:
+    """Return the numeric Digikala product id (the `dkp-` part) of a URL"""
+    match = PRODUCT_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def product_key(url: str) -> str:
+    """Canonical key of a product URL: `dkp-<id>`, or the URL without query/fragment"""
+    product_id = extract_product_id(url)
+    if product_id:
+        return f"dkp-{product_id}"
+    parts = urlsplit(url.strip())
+    return f"{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+def is_product_url(url: str) -> bool:
+    """True for http(s) links to a Digikala product page"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    return (parts.scheme in ('http', 'https')
+            and (host == 'digikala.com' or host.endswith('.digikala.com'))
+            and '/product/' in parts.path)
+
+
+def clean_url(url: str) -> str:
+    """Strip whitespace, tracking parameters and fragments from a product link"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import socket
+from typing import Dict, Optional
+
+from .executors import AsyncFacade
+
+
+class PriceWorker:
+    """Checks products claimed from a shared lease queue
+
+    Several worker processes on the database's host can run side by side: each claims a batch of due products, checks it with
+    the scheduler's sweep logic (adaptive intervals, batched writes, outbox
+    entries) and releases the leases. Products of a worker that dies are
+    claimed again once their leases expire. Emails are not sent here; the
+    main process delivers the outbox.
+    """
+
+    def __init__(self, scheduler, leases, worker_id: Optional[str] = None,
+                 batch_size: int = 10, poll_interval: float = 5):
+        """
+        Initialize worker
+
+        Args:
+            scheduler: PriceScheduler whose check_products() does the checking
+            leases: SQLiteLeaseBackend or RedisLeaseBackend
+            worker_id: Owner name of the leases (default: host-pid)
+            batch_size: Products claimed at a time
+            poll_interval: Seconds to wait when nothing is due
+        """
+        self.scheduler = scheduler
+        self.leases = AsyncFacade(leases, 'leases', max_workers=1)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.is_running = False
+        self.stats = {'batches': 0, 'checked': 0, 'succeeded': 0, 'failed': 0}
+
+    async def run(self, until_idle: bool = False):
+        """
+        Claim and check batches until stop() is called
+
+        Args:
+            until_idle: Return as soon as no product is due (for benchmarks and tests)
+        """
+        self.is_running = True
+        print(f"👷 Worker {self.worker_id} started")
+        try:
+            while self.is_running:
+                sweep = await self.run_once()
+                if sweep is None:
+                    if until_idle:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.close()
+            print(f"👷 Worker {self.worker_id} stopped: {self.stats}")
+
+    async def run_once(self) -> Optional[Dict]:
+        """
+        Claim one batch, check it and release it
+
+        Returns:
+            The sweep stats of the batch, None if nothing was due
+        """
+        if await self.scheduler.async_db.get_meta_value('scheduler_paused'):
+            # Paused through the scheduler's control channel
+            return None
+        products = await self.leases.claim(self.worker_id, self.batch_size)
+        if not products:
+            return None
+        try:
+            sweep = await self.scheduler.check_products(products)
+        finally:
+            await self.leases.release(self.worker_id, products)
+
+        self.stats['batches'] += 1
+        self.stats['checked'] += len(products)
+        if sweep:
+            self.stats['succeeded'] += sweep['succeeded']
+            self.stats['failed'] += sweep['failed']
+        return sweep or {}
+
+    def stop(self):
+        self.is_running = False
+
+    async def close(self):
+        await self.scheduler.scraper.close()
+        self.leases.shutdown(wait=False)
+        self.scheduler.async_db.shutdown(wait=False)
+        self.scheduler.async_notifier.shutdown(wait=False)
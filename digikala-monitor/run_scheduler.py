@@ -0,0 +1,68 @@
+"""
+Run the price scheduler on its own
+
+Checks prices, delivers the notification outbox and scrapes products
+queued by /add, without the web server. Use it with
+SCHEDULER_PROCESS_CONFIG["mode"] = "external" (e.g. under systemd next to
+main.py); in "process" mode main.py starts it by itself. The web server
+sends it commands (check now, pause, resume) and reads its status
+through the database.
+
+Usage:
+    python run_scheduler.py
+"""
+
+import asyncio
+import signal
+import sys
+
+try:
+    from config import (
+        EMAIL_CONFIG,
+        SCHEDULER_CONFIG,
+        SCRAPER_CONFIG,
+        FETCHER_CONFIG,
+        RATE_LIMIT_CONFIG,
+        OUTBOX_CONFIG,
+        DATABASE_CONFIG,
+        WORKER_CONFIG,
+        SCHEDULER_PROCESS_CONFIG
+    )
+except ImportError:
+    print("❌ Error: config.py not found!")
+    print("📝 Please copy config.example.py to config.py and fill in your details")
+    sys.exit(1)
+
+from price_monitor.control import SchedulerControl
+from price_monitor.database import PriceDatabase
+from price_monitor.notifier import EmailNotifier
+from price_monitor.ratelimit import create_rate_limiter
+from price_monitor.scheduler import PriceScheduler
+from price_monitor.scraper import DigikalaScraper, TieredFetcher
+
+
+def main():
+    db = PriceDatabase(**DATABASE_CONFIG)
+    scraper = TieredFetcher(DigikalaScraper(**SCRAPER_CONFIG), **FETCHER_CONFIG,
+                            rate_limiter=create_rate_limiter(**RATE_LIMIT_CONFIG))
+    notifier = EmailNotifier(**EMAIL_CONFIG)
+    scheduler = PriceScheduler(db, scraper, notifier, outbox_options=OUTBOX_CONFIG,
+                               run_checks=not WORKER_CONFIG["enabled"], **SCHEDULER_CONFIG)
+    control = SchedulerControl(
+        scheduler,
+        poll_interval=SCHEDULER_PROCESS_CONFIG["poll_interval"],
+        status_interval=SCHEDULER_PROCESS_CONFIG["status_interval"]
+    )
+    # main.py's "process" mode ends this process with terminate() (SIGTERM);
+    # stopping the scheduler lets start() return and shut everything down
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        asyncio.run(control.run_scheduler())
+    except KeyboardInterrupt:
+        print("\n⏹️ Scheduler process stopped")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Run price-check workers in separate processes
+
+Each process has its own event loop, browser pool and database
+connections, and claims due products through WORKER_CONFIG's lease
+backend. Start it next to main.py (with WORKER_CONFIG["enabled"] = True,
+so main.py only serves the dashboard and sends emails) on this machine.
+All workers share the local SQLite file, so they must run on the host
+that stores it, whichever lease backend is used.
+
+Usage:
+    python run_workers.py [--processes 4] [--backend sqlite|redis]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+
+try:
+    from config import (
+        EMAIL_CONFIG,
+        SCHEDULER_CONFIG,
+        SCRAPER_CONFIG,
+        FETCHER_CONFIG,
+        RATE_LIMIT_CONFIG,
+        DATABASE_CONFIG,
+        WORKER_CONFIG
+    )
+except ImportError:
+    print("❌ Error: config.py not found!")
+    print("📝 Please copy config.example.py to config.py and fill in your details")
+    sys.exit(1)
+
+from price_monitor.database import PriceDatabase
+from price_monitor.leases import create_lease_backend
+from price_monitor.notifier import EmailNotifier
+from price_monitor.ratelimit import create_rate_limiter
+from price_monitor.scheduler import PriceScheduler
+from price_monitor.scraper import DigikalaScraper, TieredFetcher
+from price_monitor.worker import PriceWorker
+
+
+def run_worker(backend: str, redis_url: str):
+    """Body of one worker process"""
+    db = PriceDatabase(**DATABASE_CONFIG)
+    # Each process has its own limiter, so the total rate is `processes` times the configured one
+    scraper = TieredFetcher(DigikalaScraper(**SCRAPER_CONFIG), **FETCHER_CONFIG,
+                            rate_limiter=create_rate_limiter(**RATE_LIMIT_CONFIG))
+    # Only used for its digest settings; the main process sends the emails
+    notifier = EmailNotifier(**EMAIL_CONFIG)
+    scheduler = PriceScheduler(db, scraper, notifier, **SCHEDULER_CONFIG)
+    leases = create_lease_backend(db, backend, WORKER_CONFIG["lease_seconds"], redis_url)
+    worker = PriceWorker(
+        scheduler, leases,
+        batch_size=WORKER_CONFIG["batch_size"],
+        poll_interval=WORKER_CONFIG["poll_interval"]
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run price-check worker processes")
+    parser.add_argument("--processes", type=int, default=WORKER_CONFIG["processes"])
+    parser.add_argument("--backend", choices=("sqlite", "redis"), default=WORKER_CONFIG["backend"])
+    parser.add_argument("--redis-url", default=WORKER_CONFIG["redis_url"])
+    args = parser.parse_args()
+
+    # A fresh interpreter per process: no inherited event loop, browser or SQLite state
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(args.backend, args.redis_url), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    print(f"🚀 Starting {len(processes)} workers ({args.backend} leases)...")
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopping workers...")
+        for process in processes:
+            process.join(timeout=30)
@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime, timedelta
+
+from price_monitor.downsample import downsample, lttb, minmax
+
+
+def make_points(closes):
+    """Hourly history points, oldest first"""
+    start = datetime(2025, 1, 1)
+    return [{'time': (start + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+             'open': close, 'close': close, 'min': close, 'max': close, 'count': 1}
+            for i, close in enumerate(closes)]
+
+
+class LttbTest(unittest.TestCase):
+    def setUp(self):
+        self.points = make_points([100, 90, 120, 80, 110, 95, 130, 70, 105, 100, 115, 85])
+
+    def test_keeps_endpoints_and_target_length(self):
+        for target in (3, 4, 6, 11):
+            picked = lttb(self.points, target)
+            self.assertEqual(len(picked), target)
+            self.assertIs(picked[0], self.points[0])
+            self.assertIs(picked[-1], self.points[-1])
+            times = [point['time'] for point in picked]
+            self.assertEqual(times, sorted(times))
+
+    def test_short_input_unchanged(self):
+        self.assertEqual(lttb(self.points[:5], 5), self.points[:5])
+        self.assertEqual(lttb(self.points[:5], 100), self.points[:5])
+
+    def test_small_targets(self):
+        self.assertEqual(lttb(self.points, 0), [])
+        self.assertEqual(lttb(self.points, 1), [self.points[-1]])
+        self.assertEqual(lttb(self.points, 2), [self.points[0], self.points[-1]])
+
+    def test_keeps_spike(self):
+        points = make_points([100] * 10 + [300] + [100] * 9)
+        self.assertIn(300, [point['close'] for point in lttb(points, 5)])
+
+
+class MinmaxTest(unittest.TestCase):
+    def test_buckets_keep_extremes(self):
+        points = make_points([100, 90, 120, 80, 110, 95, 130, 70])
+        buckets = minmax(points, 4)
+        self.assertLessEqual(len(buckets), 4)
+        self.assertEqual(sum(bucket['count'] for bucket in buckets), len(points))
+        self.assertEqual(min(bucket['min'] for bucket in buckets), 70)
+        self.assertEqual(max(bucket['max'] for bucket in buckets), 130)
+        self.assertEqual(buckets[0]['open'], 100)
+        self.assertEqual(buckets[-1]['close'], 70)
+
+    def test_short_input_unchanged(self):
+        points = make_points([100, 90])
+        self.assertEqual(minmax(points, 5), points)
+
+
+class DownsampleTest(unittest.TestCase):
+    def test_dispatch(self):
+        points = make_points(range(20))
+        self.assertEqual(downsample(points, 5, "lttb"), lttb(points, 5))
+        self.assertEqual(downsample(points, 5), minmax(points, 5))
+        with self.assertRaises(ValueError):
+            downsample(points, 5, "average")
+
+
+if __name__ == "__main__":
+    unittest.main()
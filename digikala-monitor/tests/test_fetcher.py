@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+
+from benchmarks.fake_digikala import FakeDigikalaServer
+from price_monitor.scraper import TieredFetcher
+
+
+class FakeBrowser:
+    """Stands in for DigikalaScraper (the Playwright tier)"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def scrape_product(self, url: str):
+        self.calls.append(url)
+        return {'name': 'rendered', 'price': 1234}
+
+    async def close(self):
+        pass
+
+
+class TieredFetcherTest(unittest.TestCase):
+    """Tier order, single-flight and the result cache, against the local fake Digikala"""
+
+    def setUp(self):
+        self.server = FakeDigikalaServer(churn=0, seed=1).start()
+        self.browser = FakeBrowser()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _fetcher(self, **options) -> TieredFetcher:
+        return TieredFetcher(self.browser, api_url_template=self.server.api_url_template, **options)
+
+    def _run(self, fetcher: TieredFetcher, coroutine_factory):
+        async def run():
+            try:
+                return await coroutine_factory()
+            finally:
+                await fetcher.close()
+        return asyncio.run(run())
+
+    def test_api_tier_first(self):
+        fetcher = self._fetcher()
+        info = self._run(fetcher, lambda: fetcher.scrape_product(self.server.product_url(1)))
+        expected = self.server.product_payload(1)
+        self.assertEqual(info['name'], expected['title_fa'])
+        self.assertEqual(info['price'], expected['default_variant']['price']['selling_price'] // 10)
+        self.assertEqual((fetcher.stats['api'], fetcher.stats['embedded'], fetcher.stats['browser']), (1, 0, 0))
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(self.browser.calls, [])
+
+    def test_embedded_when_api_fails(self):
+        self.server.api_enabled = False
+        fetcher = self._fetcher()
+        info = self._run(fetcher, lambda: fetcher.scrape_product(self.server.product_url(2)))
+        self.assertEqual(info['name'], self.server.product_payload(2)['title_fa'])
+        self.assertEqual((fetcher.stats['api'], fetcher.stats['embedded'], fetcher.stats['browser']), (0, 1, 0))
+        # The API answered 404, then the page was read once
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.browser.calls, [])
+
+    def test_browser_when_http_fails(self):
+        url = f"{self.server.base_url}/product/dkp-3/missing/"
+        fetcher = self._fetcher()
+        self.server.api_enabled = False
+        info = self._run(fetcher, lambda: fetcher.scrape_product(url))
+        self.assertEqual(info, {'name': 'rendered', 'price': 1234})
+        self.assertEqual(fetcher.stats['browser'], 1)
+        self.assertEqual(self.browser.calls, [url])
+
+    def test_single_flight(self):
+        self.server.latency = 0.05
+        fetcher = self._fetcher()
+        urls = [self.server.product_url(4), self.server.product_url(4) + "?utm_source=x",
+                f"{self.server.base_url}/product/dkp-4/slug/"] * 4
+        results = self._run(fetcher, lambda: asyncio.gather(*(fetcher.scrape_product(url) for url in urls)))
+        self.assertEqual(len({(info['name'], info['price']) for info in results}), 1)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(fetcher.cache_stats, {'hits': 0, 'misses': 1, 'coalesced': len(urls) - 1})
+
+    def test_cache_ttl(self):
+        fetcher = self._fetcher(cache_ttl=0.2)
+
+        async def fetch_three_times():
+            url = self.server.product_url(5)
+            await fetcher.scrape_product(url)
+            await fetcher.scrape_product(url)
+            cached_requests = self.server.requests
+            await asyncio.sleep(0.3)
+            await fetcher.scrape_product(url)
+            return cached_requests
+
+        self.assertEqual(self._run(fetcher, fetch_three_times), 1)
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(fetcher.cache_stats['hits'], 1)
+
+    def test_cache_lru(self):
+        fetcher = self._fetcher(cache_size=2)
+
+        async def fetch(ids):
+            for product_id in ids:
+                await fetcher.scrape_product(self.server.product_url(product_id))
+
+        # 6 is evicted by 8; 7 was used last and stays
+        self._run(fetcher, lambda: fetch([6, 7, 7, 8, 7, 6]))
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(fetcher.cache_stats['hits'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
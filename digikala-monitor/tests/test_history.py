@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from price_monitor.database import PriceDatabase
+
+
+URL = "https://www.digikala.com/product/dkp-1/"
+PRICES = [100, 100, 90, 90, 90, 95, 95, 100]
+
+
+class HistoryModeTest(unittest.TestCase):
+    """"compact" history stores runs but reads back like "full" history"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _history(self, mode: str, limit: int):
+        db = PriceDatabase(os.path.join(self.tmpdir.name, f"{mode}-{limit}.db"), history_mode=mode)
+        try:
+            db.add_product(URL, "A", PRICES[0])
+            for price in PRICES[1:]:
+                db.update_price(URL, price)
+            rows = db._connection().execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+            return db.get_price_history(URL, limit), rows
+        finally:
+            db.close()
+
+    def test_same_observations(self):
+        for limit in (1, 3, 6, 100):
+            full, full_rows = self._history("full", limit)
+            compact, compact_rows = self._history("compact", limit)
+            self.assertEqual([entry['price'] for entry in compact], [entry['price'] for entry in full])
+            self.assertEqual(len(compact), min(limit, len(PRICES)))
+            self.assertTrue(all(entry['observation_count'] == 1 for entry in compact))
+            self.assertLess(compact_rows, full_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
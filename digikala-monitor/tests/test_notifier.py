@@ -0,0 +1,114 @@
+import asyncio
+import email
+import os
+import socket
+import tempfile
+import unittest
+from email.header import decode_header, make_header
+
+from aiosmtpd.controller import Controller
+
+from price_monitor.database import PriceDatabase
+from price_monitor.notifier import EmailNotifier
+from price_monitor.scheduler import PriceScheduler
+
+
+PRODUCTS = 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Mailbox:
+    """aiosmtpd handler keeping every accepted message; refuses recipients when `refuse` is set"""
+
+    def __init__(self, refuse: bool = False):
+        self.refuse = refuse
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self.refuse:
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return '250 Message accepted'
+
+
+class FakeScraper:
+    """Every product is now half price"""
+
+    async def scrape_product(self, url: str):
+        return {'name': url, 'price': 500}
+
+    async def close(self):
+        pass
+
+
+class DigestEmailTest(unittest.TestCase):
+    """Price drops reach a local SMTP server, one digest per sweep"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = PriceDatabase(os.path.join(self.tmpdir.name, "prices.db"))
+        self.db.add_products_bulk([(f"https://www.digikala.com/product/dkp-{i}/", f"P{i}", 1000)
+                                   for i in range(1, PRODUCTS + 1)])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _sweep(self, mailbox: Mailbox) -> PriceScheduler:
+        controller = Controller(mailbox, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        try:
+            notifier = EmailNotifier("127.0.0.1", controller.port,
+                                     "monitor@example.com", "", "me@example.com",
+                                     use_tls=False, digest_mode="sweep")
+            scheduler = PriceScheduler(self.db, FakeScraper(), notifier,
+                                       outbox_options={'rate_limit_per_minute': 0})
+
+            async def run():
+                sender = asyncio.ensure_future(scheduler.outbox.run())
+                await scheduler.check_products(self.db.get_all_products())
+                # The sweep wakes the sender; give it time to send (and to wrongly send more)
+                for _ in range(50):
+                    await asyncio.sleep(0.05)
+                    if not self.db.get_outbox_stats().get('pending') and \
+                            not self.db.get_outbox_stats().get('sending'):
+                        break
+                await asyncio.sleep(0.2)
+                scheduler.outbox.stop()
+                await sender
+                await scheduler.async_notifier.close()
+
+            asyncio.run(run())
+            return scheduler
+        finally:
+            controller.stop()
+
+    def test_one_digest_per_sweep(self):
+        mailbox = Mailbox()
+        self._sweep(mailbox)
+        self.assertEqual(len(mailbox.messages), 1)
+        subject = str(make_header(decode_header(mailbox.messages[0]['Subject'])))
+        self.assertIn(str(PRODUCTS), subject)
+        self.assertEqual(self.db.get_outbox_stats(), {'sent': PRODUCTS})
+
+    def test_refused_recipient_is_permanent(self):
+        mailbox = Mailbox(refuse=True)
+        scheduler = self._sweep(mailbox)
+        self.assertEqual(mailbox.messages, [])
+        # Given up after one attempt, without reconnecting to resend
+        self.assertEqual(self.db.get_outbox_stats(), {'dead': PRODUCTS})
+        self.assertEqual(scheduler.notifier.stats['reconnects'], 0)
+        self.assertTrue(scheduler.notifier.last_error_permanent)
+
+
+if __name__ == "__main__":
+    unittest.main()
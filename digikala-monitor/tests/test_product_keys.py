@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from price_monitor.database import PriceDatabase
+
+
+BASE = "https://www.digikala.com/product/dkp-1/"
+
+
+class ProductKeyTest(unittest.TestCase):
+    """Every url of a product (slug, query string, fragment) resolves to the same row"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = PriceDatabase(os.path.join(self.tmpdir.name, "prices.db"))
+        self.db.add_product(BASE + "?utm_source=x", "A", 1000)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_one_row_per_product(self):
+        self.assertFalse(self.db.add_product(BASE + "some-slug/", "A", 900))
+        self.assertIsNone(self.db.enqueue_add_job(BASE + "#reviews"))
+        self.assertEqual(self.db.get_product_urls(), [BASE])
+
+    def test_updates_match_any_url(self):
+        drop = self.db.update_price(BASE + "some-slug/?utm_medium=y", 800)
+        self.assertEqual(drop['new_price'], 800)
+        self.assertEqual(drop['url'], BASE)
+        self.db.reschedule_products([(BASE + "#x", 3600)])
+        product = self.db.get_all_products()[0]
+        self.assertEqual(product['current_price'], 800)
+        self.assertIsNotNone(product['next_check_at'])
+        self.assertEqual(len(self.db.get_price_history(BASE + "?a=1")), 2)
+
+    def test_merge_keeps_full_history(self):
+        conn = self.db._connection()
+        with self.db._transaction() as cursor:
+            # A duplicate row as stored before product keys existed
+            cursor.execute('''
+                INSERT INTO products (url, product_key, name, current_price, lowest_price, last_checked)
+                VALUES (?, 'legacy', 'A', 700, 700, datetime('now', '+1 minute'))
+            ''', (BASE + "some-slug/",))
+            duplicate = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO price_history (product_id, price, checked_at) VALUES (?, 1000, datetime('now', ?))",
+                [(duplicate, f"+{i} seconds") for i in range(1, 4)]
+            )
+        with self.db._transaction() as cursor:
+            self.db._merge_products(cursor, 1, [duplicate])
+
+        product = self.db.get_all_products()
+        self.assertEqual(len(product), 1)
+        self.assertEqual((product[0]['current_price'], product[0]['lowest_price']), (700, 700))
+        # "full" mode keeps one row per check, nothing is folded into runs
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from price_monitor.database import PriceDatabase
+
+
+URL = "https://www.digikala.com/product/dkp-1/"
+
+
+class HistoryQueryPlanTest(unittest.TestCase):
+    """History lookups must use the (product_id, checked_at) index instead of scanning and sorting"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "prices.db")
+
+        # A database from before versioning: base tables, data, user_version 0
+        conn = sqlite3.connect(self.path)
+        conn.executescript('''
+            CREATE TABLE products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                current_price INTEGER NOT NULL,
+                lowest_price INTEGER NOT NULL,
+                last_checked TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE price_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            );
+        ''')
+        conn.execute(
+            "INSERT INTO products (url, name, current_price, lowest_price) VALUES (?, 'A', 100, 100)",
+            (URL,)
+        )
+        conn.executemany(
+            "INSERT INTO price_history (product_id, price, checked_at) VALUES (1, ?, datetime('now', ?))",
+            [(100 + i, f"-{i} minutes") for i in range(50)]
+        )
+        conn.commit()
+        conn.close()
+
+        self.db = PriceDatabase(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _plan(self, call) -> str:
+        """EXPLAIN QUERY PLAN of the statement `call` runs on the database connection"""
+        statements = []
+        conn = self.db._connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        query = next(sql for sql in statements if "FROM price_history" in sql)
+        return "\n".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+
+    def test_migrated_in_place(self):
+        version = self.db._connection().execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, len(PriceDatabase.MIGRATIONS))
+        self.assertEqual(len(self.db.get_price_history(URL, limit=100)), 50)
+
+    def test_price_history_uses_index(self):
+        plan = self._plan(lambda: self.db.get_price_history(URL, limit=10))
+        self.assertIn("idx_price_history_product_checked", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotIn("SCAN price_history", plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
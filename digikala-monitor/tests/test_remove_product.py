@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from price_monitor.database import PriceDatabase
+
+
+URL = "https://www.digikala.com/product/dkp-1/"
+OTHER = "https://www.digikala.com/product/dkp-2/"
+TABLES = ('price_history', 'price_rollup_hourly', 'price_rollup_daily', 'product_leases', 'add_jobs')
+
+
+class RemoveProductTest(unittest.TestCase):
+    """Removing a product deletes every row that belongs to it, and only those"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = PriceDatabase(os.path.join(self.tmpdir.name, "prices.db"))
+        for url in (URL, OTHER):
+            self.db.add_product(url, "A", 100)
+            self.db.update_price(url, 90)
+        self.db.claim_due_products("worker", 10)
+        with self.db._transaction() as cursor:
+            cursor.execute("INSERT INTO add_jobs (url, status, product_id) VALUES (?, 'done', 1)", (URL,))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _counts(self, product_id: int):
+        conn = self.db._connection()
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE product_id = ?",
+                                    (product_id,)).fetchone()[0]
+                for table in TABLES}
+
+    def test_dependent_rows_deleted(self):
+        self.assertTrue(all(self._counts(1).values()))
+        self.assertTrue(self.db.remove_product(URL + "?utm_source=x"))
+        self.assertEqual(set(self._counts(1).values()), {0})
+        self.assertTrue(all(count for table, count in self._counts(2).items() if table != 'add_jobs'))
+        self.assertEqual(self.db.get_product_urls(), [OTHER])
+
+
+if __name__ == "__main__":
+    unittest.main()
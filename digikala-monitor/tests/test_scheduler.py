@@ -0,0 +1,58 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from price_monitor.database import PriceDatabase
+from price_monitor.scheduler import PriceScheduler
+
+
+class FakeScraper:
+    async def close(self):
+        pass
+
+
+class FakeNotifier:
+    digest_mode = "off"
+    last_error = None
+
+    def close(self):
+        pass
+
+
+class SchedulerErrorTest(unittest.TestCase):
+    """A failing sweep is logged and retried; start() still returns on stop()"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = PriceDatabase(os.path.join(self.tmpdir.name, "prices.db"))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_survives_database_errors(self):
+        attempts = []
+
+        def broken(*args):
+            attempts.append(1)
+            raise RuntimeError("database is locked")
+
+        self.db.get_all_products = broken
+        self.db.get_due_products = broken
+        scheduler = PriceScheduler(self.db, FakeScraper(), FakeNotifier())
+        scheduler.ERROR_RETRY_SECONDS = 0.05
+
+        async def run():
+            task = asyncio.ensure_future(scheduler.start())
+            await asyncio.sleep(0.5)
+            self.assertFalse(task.done())
+            scheduler.stop()
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(run())
+        self.assertGreater(len(attempts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from price_monitor.api import parse_timestamp
+from price_monitor.database import PriceDatabase
+from price_monitor.timeutils import utc_now
+
+
+URL = "https://www.digikala.com/product/dkp-1/"
+
+
+class ParseTimestampTest(unittest.TestCase):
+    def test_utc_forms(self):
+        expected = datetime(2024, 5, 1, 12, 0, 0)
+        for value in ("2024-05-01T12:00:00", "2024-05-01 12:00:00", "2024-05-01T12:00:00Z",
+                      "2024-05-01T15:30:00+03:30", "1714564800"):
+            self.assertEqual(parse_timestamp(value), expected, value)
+
+
+class StoredTimestampTest(unittest.TestCase):
+    """last_checked/last_changed_at are UTC like the rest of the schema"""
+
+    def setUp(self):
+        # A non-UTC local zone, so local timestamps would be off by hours
+        self.old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Asia/Tehran'
+        time.tzset()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = PriceDatabase(os.path.join(self.tmpdir.name, "prices.db"))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+        if self.old_tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.old_tz
+        time.tzset()
+
+    def test_since_filters_in_utc(self):
+        before = utc_now() - timedelta(seconds=1)
+        self.db.add_product(URL, "A", 100)
+        self.db.update_prices_bulk([(URL, 90)])
+
+        row = self.db._connection().execute(
+            "SELECT last_checked, last_changed_at, datetime('now') FROM products").fetchone()
+        now = datetime.fromisoformat(row[2])
+        for value in row[:2]:
+            self.assertLess(abs(datetime.fromisoformat(value) - now), timedelta(minutes=1))
+
+        since = parse_timestamp(before.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        self.assertEqual(len(self.db.get_products_page(since=since, changed_only=True)), 1)
+        later = parse_timestamp((utc_now() + timedelta(minutes=5)).isoformat())
+        self.assertEqual(self.db.get_products_page(since=later), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
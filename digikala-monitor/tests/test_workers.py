@@ -0,0 +1,150 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+
+from price_monitor.database import PriceDatabase
+from price_monitor.leases import RedisLeaseBackend, SQLiteLeaseBackend
+from price_monitor.scheduler import PriceScheduler
+from price_monitor.worker import PriceWorker
+
+
+PRODUCTS = 60
+
+
+class FakeScraper:
+    """Stands in for Digikala; counts the fetches of every url across workers"""
+
+    def __init__(self, fetches: Counter, lock: threading.Lock):
+        self.fetches = fetches
+        self.lock = lock
+
+    async def scrape_product(self, url: str):
+        with self.lock:
+            self.fetches[url] += 1
+        await asyncio.sleep(0.005)
+        return {'name': url, 'price': 900}
+
+    async def close(self):
+        pass
+
+
+class FakeNotifier:
+    digest_mode = "off"
+    last_error = None
+
+    def close(self):
+        pass
+
+
+class FakeRedis:
+    """The SET NX EX / compare-and-delete subset RedisLeaseBackend uses"""
+
+    def __init__(self):
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            current = self.keys.get(key)
+            if nx and current and current[1] > time.monotonic():
+                return None
+            self.keys[key] = (value, time.monotonic() + ex)
+            return True
+
+    def register_script(self, script):
+        def release(keys, args):
+            with self.lock:
+                if self.keys.get(keys[0], (None,))[0] == args[0]:
+                    del self.keys[keys[0]]
+        return release
+
+    def expire_all(self):
+        with self.lock:
+            self.keys = {key: (owner, 0) for key, (owner, _) in self.keys.items()}
+
+
+class WorkerLeaseTest(unittest.TestCase):
+    """Two workers sharing one database check every product exactly once"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "prices.db")
+        db = PriceDatabase(self.path)
+        db.add_products_bulk([(f"https://www.digikala.com/product/dkp-{i}/", f"P{i}", 1000)
+                              for i in range(1, PRODUCTS + 1)])
+        db.close()
+        self.fetches = Counter()
+        self.lock = threading.Lock()
+        self.databases = []
+
+    def tearDown(self):
+        for db in self.databases:
+            db.close()
+        self.tmpdir.cleanup()
+
+    def _worker(self, name: str, make_leases) -> PriceWorker:
+        # Own PriceDatabase per worker, like separate processes
+        db = PriceDatabase(self.path)
+        self.databases.append(db)
+        scheduler = PriceScheduler(db, FakeScraper(self.fetches, self.lock), FakeNotifier(),
+                                   adaptive=True, run_checks=False)
+        return PriceWorker(scheduler, make_leases(db), worker_id=name, batch_size=5, poll_interval=0.01)
+
+    def _run_two_workers(self, make_leases):
+        workers = [self._worker(name, make_leases) for name in ("worker-a", "worker-b")]
+
+        async def run():
+            await asyncio.gather(*(worker.run(until_idle=True) for worker in workers))
+
+        asyncio.run(run())
+        return workers
+
+    def test_sqlite_no_duplicate_claims(self):
+        workers = self._run_two_workers(SQLiteLeaseBackend)
+        self.assertEqual(len(self.fetches), PRODUCTS)
+        self.assertEqual(set(self.fetches.values()), {1})
+        self.assertEqual(sum(worker.stats['checked'] for worker in workers), PRODUCTS)
+        self.assertTrue(all(worker.stats['checked'] for worker in workers))
+
+    def test_redis_no_duplicate_claims(self):
+        redis = FakeRedis()
+        self._run_two_workers(lambda db: RedisLeaseBackend(db, client=redis))
+        self.assertEqual(len(self.fetches), PRODUCTS)
+        self.assertEqual(set(self.fetches.values()), {1})
+
+    def test_sqlite_expired_leases_reclaimed(self):
+        db = PriceDatabase(self.path)
+        self.databases.append(db)
+        leases = SQLiteLeaseBackend(db, lease_seconds=300)
+        crashed = leases.claim("crashed-worker", 10)
+        self.assertEqual(len(crashed), 10)
+
+        # Leased products are skipped while the lease is alive...
+        others = leases.claim("worker-b", PRODUCTS)
+        self.assertFalse({p['id'] for p in crashed} & {p['id'] for p in others})
+        leases.release("worker-b", others)
+
+        # ...and come back once it has expired
+        db._connection().execute(
+            "UPDATE product_leases SET expires_at = datetime('now', '-1 second') WHERE owner = 'crashed-worker'"
+        )
+        reclaimed = leases.claim("worker-b", PRODUCTS)
+        self.assertTrue({p['id'] for p in crashed} <= {p['id'] for p in reclaimed})
+
+    def test_redis_expired_leases_reclaimed(self):
+        db = PriceDatabase(self.path)
+        self.databases.append(db)
+        redis = FakeRedis()
+        leases = RedisLeaseBackend(db, client=redis, candidates_factor=PRODUCTS)
+        crashed = {p['id'] for p in leases.claim("crashed-worker", 10)}
+        self.assertFalse(crashed & {p['id'] for p in leases.claim("worker-b", PRODUCTS)})
+        redis.expire_all()
+        self.assertTrue(crashed <= {p['id'] for p in leases.claim("worker-b", PRODUCTS)})
+
+
+if __name__ == "__main__":
+    unittest.main()